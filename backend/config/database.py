@@ -0,0 +1,103 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from postgrest.exceptions import APIError
+
+from config.supabase_client import supabase
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Max worker threads running blocking PostgREST calls
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "32"))
+# Max queries in flight at once (per process); extra callers wait their turn
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", str(DB_POOL_SIZE)))
+
+# PostgREST (schema cache) and Postgres codes for objects that aren't deployed
+MISSING_RELATION_CODES = frozenset({"PGRST205", "42P01"})
+MISSING_FUNCTION_CODES = frozenset({"PGRST202", "42883"})
+
+# Missing objects already logged, so fallbacks warn once per process
+_reported_missing = set()
+
+
+def _is_missing(error: Exception, codes: frozenset) -> bool:
+    if not isinstance(error, APIError) or error.code not in codes:
+        return False
+    if error.message not in _reported_missing:
+        _reported_missing.add(error.message)
+        logger.warning("Using fallback queries: %s (%s)", error.message, error.code)
+    return True
+
+
+def is_missing_relation(error: Exception) -> bool:
+    """True if `error` says a table or view doesn't exist (yet)"""
+    return _is_missing(error, MISSING_RELATION_CODES)
+
+
+def is_missing_function(error: Exception) -> bool:
+    """True if `error` says a database function doesn't exist (yet)"""
+    return _is_missing(error, MISSING_FUNCTION_CODES)
+
+
+def is_data_error(error: Exception) -> bool:
+    """
+    True if Postgres rejected the statement's data (SQLSTATE class 22, data
+    exception, or 23, integrity constraint violation). Nothing was written,
+    so retrying a subset of the rows is safe; transport errors and timeouts
+    may have committed and must not be retried.
+    """
+    return isinstance(error, APIError) and (error.code or "")[:2] in ("22", "23")
+
+
+class Database:
+    """
+    Async data-access layer over the synchronous Supabase client.
+
+    Query builders are cheap to construct, so routers build them as usual and
+    hand them to `execute()`, which runs the blocking round trip on a bounded
+    thread pool instead of the event loop.
+    """
+
+    def __init__(self, client, pool_size: int = DB_POOL_SIZE, max_concurrency: int = DB_MAX_CONCURRENCY):
+        self.client = client
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+        self._semaphore = None
+
+    def table(self, name: str):
+        return self.client.table(name)
+
+    def _limiter(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, func, *args):
+        """Run a blocking callable on the database pool"""
+        async with self._limiter():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def execute(self, query):
+        """Execute a PostgREST query builder without blocking the event loop"""
+        return await self.run(query.execute)
+
+    async def gather(self, *queries):
+        """Execute independent queries concurrently, returning responses in order"""
+        return await asyncio.gather(*(self.execute(q) for q in queries))
+
+    async def rpc(self, fn: str, params: dict = None):
+        """Call a database function"""
+        return await self.execute(self.client.rpc(fn, params or {}))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+db = Database(supabase)
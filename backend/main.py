@@ -6,8 +6,11 @@ from dotenv import load_dotenv
 import os
 from pathlib import Path
 
-from routers import tickets, employees, employee_time
-from config.supabase_client import supabase
+from routers import tickets, employees, employee_time, stream
+from config.database import db
+from middleware.auth import start_key_refresh, stop_key_refresh
+from middleware.compression import CompressionMiddleware
+from middleware.responses import FastJSONResponse
 
 # Load environment variables
 load_dotenv()
@@ -15,7 +18,8 @@ load_dotenv()
 app = FastAPI(
     title="TicketFlow - Jira-like Ticket Management System",
     version="3.0.0",
-    description="Complete ticket management system with employee assignments, time tracking, and recommendations"
+    description="Complete ticket management system with employee assignments, time tracking, and recommendations",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -31,10 +35,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated brotli/gzip compression for larger responses
+app.add_middleware(CompressionMiddleware)
+
 # Include routers
 app.include_router(tickets.router, prefix="/api/tickets", tags=["tickets"])
 app.include_router(employees.router, prefix="/api/employees", tags=["employees"])
 app.include_router(employee_time.router, prefix="/api/time", tags=["time-tracking"])
+app.include_router(stream.router, prefix="/api/stream", tags=["stream"])
+
+# Keep JWT signing keys warm in the background
+app.add_event_handler("startup", start_key_refresh)
+app.add_event_handler("shutdown", stop_key_refresh)
+
+# Release database worker threads on shutdown
+app.add_event_handler("shutdown", db.close)
 
 
 @app.get("/api/health")
@@ -1,28 +1,154 @@
-from fastapi import Header, HTTPException
-from config.supabase_client import supabase
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import httpx
 import jwt
+from fastapi import Header, HTTPException
 from types import SimpleNamespace
+from dotenv import load_dotenv
+from services.cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
+# Legacy HS256 projects sign with the shared JWT secret; newer ones publish keys via JWKS
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# Don't refetch JWKS for unknown key ids more often than this
+JWKS_MIN_REFETCH_SECONDS = 30
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+# Verified claims keyed by token hash, each kept until the token's exp
+claims_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_MAX_TTL", "3600"))
+)
+
+
+class SigningKeys:
+    """Public signing keys from the Supabase JWKS endpoint, keyed by kid"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.keys = {}
+        self.fetched_at = 0.0
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def _fetch(self):
+        response = httpx.get(self.url, timeout=10)
+        response.raise_for_status()
+        jwk_set = jwt.PyJWKSet.from_dict(response.json())
+        return {key.key_id: key for key in jwk_set.keys}
+
+    async def refresh(self):
+        async with self._lock:
+            try:
+                self.keys = await asyncio.to_thread(self._fetch)
+            except jwt.PyJWKSetError:
+                # No asymmetric keys published (HS256-only project)
+                self.keys = {}
+            finally:
+                self.fetched_at = time.monotonic()
+
+    async def get(self, kid: str):
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.fetched_at > JWKS_MIN_REFETCH_SECONDS:
+            # Possibly a rotated key we haven't seen yet
+            await self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    async def _refresh_forever(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("JWKS refresh failed: %s", e)
+            await asyncio.sleep(JWKS_REFRESH_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_forever())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+signing_keys = SigningKeys(JWKS_URL)
+
+
+async def start_key_refresh():
+    signing_keys.start()
+
+
+async def stop_key_refresh():
+    signing_keys.stop()
+
+
+async def verify_token(token: str) -> dict:
+    """Verify a Supabase access token's signature, expiry and audience"""
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise HTTPException(status_code=401, detail="Invalid token: HS256 tokens are not accepted")
+        key = SUPABASE_JWT_SECRET
+    elif algorithm in ASYMMETRIC_ALGORITHMS:
+        try:
+            key = await signing_keys.get(header.get("kid"))
+        except (httpx.HTTPError, ValueError) as e:
+            raise HTTPException(status_code=503, detail=f"Unable to load signing keys: {str(e)}")
+        if key is None:
+            raise HTTPException(status_code=401, detail="Invalid token: unknown signing key")
+        key = key.key
+    else:
+        raise HTTPException(status_code=401, detail=f"Invalid token: unsupported algorithm {algorithm}")
+
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=SUPABASE_JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]}
+    )
+
+
+async def authenticate(token: str):
+    """Resolve a bearer token to the current user, verifying it at most once per token"""
+    token_hash = hashlib.sha256(token.encode()).digest()
+
+    claims = claims_cache.get(token_hash)
+    if claims is None:
+        try:
+            claims = await verify_token(token)
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError as e:
+            raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+
+        # Serve repeat requests from memory until the token expires
+        remaining = claims["exp"] - time.time()
+        if remaining > 0:
+            claims_cache.set(token_hash, claims, ttl=min(remaining, claims_cache.ttl))
+
+    # Return user object with id and email as attributes
+    return SimpleNamespace(id=claims['sub'], email=claims.get('email'))
+
 
 async def get_current_user(authorization: str = Header(None)):
     """Extract and verify user from JWT token"""
     if not authorization or not authorization.startswith('Bearer '):
         raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
-    
-    token = authorization.split(' ')[1]
-    
-    try:
-        # Decode JWT to get user ID (Supabase JWT contains 'sub' claim with user ID)
-        # We don't verify signature here since Supabase RLS will verify at DB level
-        decoded = jwt.decode(token, options={"verify_signature": False})
-        user_id = decoded.get('sub')
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token: no user ID")
-        
-        # Return user object with id and email as attributes
-        return SimpleNamespace(id=user_id, email=decoded.get('email'))
-    except jwt.DecodeError as e:
-        raise HTTPException(status_code=401, detail=f"Invalid token format: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
+    return await authenticate(authorization.split(' ')[1])
@@ -0,0 +1,49 @@
+import functools
+import inspect
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.routing import APIRoute
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    JSON response rendered with orjson. orjson handles dicts, lists,
+    datetimes and UUIDs natively; anything else (e.g. a pydantic model)
+    goes through jsonable_encoder first.
+    """
+
+    def render(self, content) -> bytes:
+        try:
+            return orjson.dumps(content, option=ORJSON_OPTIONS)
+        except TypeError:
+            return orjson.dumps(jsonable_encoder(content), option=ORJSON_OPTIONS)
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Route that hands handler results straight to FastJSONResponse.
+
+    FastAPI otherwise runs every plain dict through jsonable_encoder before
+    rendering, which costs far more than the encoding itself on large
+    lists. Routes with a response model (which need validation) and sync
+    handlers are left alone, as are handlers returning their own Response.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        if self.response_field is None and inspect.iscoroutinefunction(self.dependant.call):
+            # The request handler built above reads dependant.call per request
+            self.dependant.call = self._render_fast(self.dependant.call, self.status_code or 200)
+
+    @staticmethod
+    def _render_fast(call, status_code: int):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            content = await call(*args, **kwargs)
+            if isinstance(content, Response):
+                return content
+            return FastJSONResponse(content, status_code=status_code)
+        return endpoint
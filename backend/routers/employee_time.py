@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel, Field
-from typing import Optional, List
+import os
+import json
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional
 from datetime import datetime, date, timedelta
-from config.supabase_client import supabase
+from config.database import db, is_data_error, is_missing_relation
+from middleware.responses import FastJSONRoute
 from middleware.auth import get_current_user
+from services.pagination import COUNT_PATTERN, apply_keyset, paginate, read_all
+from services.export import EXPORT_FORMAT_PATTERN, export_response
+from services.directory import get_employee_directory
+from services.loaders import Loaders, get_loaders
+from services.fieldsets import FIELDS_DESCRIPTION, select_fields
+from services.time_aggregation import GRANULARITY_PATTERN, TimeLogSummary, hours_to_complete, period_series
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 # ============================================
 # PYDANTIC MODELS
@@ -31,13 +41,175 @@ class TimeLogUpdate(BaseModel):
     end_time: Optional[datetime] = None
     is_billable: Optional[bool] = None
 
-class TimeLogBatch(BaseModel):
-    logs: List[TimeLogCreate]
+# ============================================
+# BATCH IMPORT
+# ============================================
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows validated and inserted per round trip by /batch
+TIME_LOG_BATCH_CHUNK_SIZE = int(os.getenv("TIME_LOG_BATCH_CHUNK_SIZE", "500"))
+
+def _time_log_row(log: TimeLogCreate, user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "employee_id": log.employee_id,
+        "ticket_id": log.ticket_id,
+        "description": log.description,
+        "hours_worked": log.hours_worked,
+        "work_date": log.work_date.isoformat(),
+        "start_time": log.start_time.isoformat() if log.start_time else None,
+        "end_time": log.end_time.isoformat() if log.end_time else None,
+        "is_billable": log.is_billable
+    }
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in error.errors()
+    )
+
+async def _ndjson_items(request: Request):
+    """Yield (line_index, parsed_object_or_error) pairs from a streamed NDJSON body"""
+    buffer = b""
+    index = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, _parse_ndjson_line(line)
+                index += 1
+    if buffer.strip():
+        yield index, _parse_ndjson_line(buffer)
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {str(e)}")
+
+class TimeLogImporter:
+    """
+    Validates and inserts time logs chunk by chunk.
+
+    Employees are checked against the cached directory; tickets go
+    through the request's ticket loader, so each chunk costs one IN lookup
+    for tickets not seen in earlier chunks, and one insert. If the database
+    rejects a chunk's data, its rows are retried one at a time so a single
+    bad row is reported without losing the others. Any other failure (e.g.
+    a timeout, after which the chunk may have committed) is raised rather
+    than risk inserting rows twice.
+    """
+
+    def __init__(self, user_id: str, loaders: Loaders, return_rows: bool = True, chunk_size: int = TIME_LOG_BATCH_CHUNK_SIZE):
+        self.user_id = user_id
+        self.tickets = loaders.tickets
+        self.return_rows = return_rows
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.created = 0
+        self.rows = []
+        self.errors = []
+
+    async def add(self, index: int, item):
+        if isinstance(item, Exception):
+            self.errors.append({"row": index, "error": str(item)})
+            return
+        try:
+            log = TimeLogCreate.model_validate(item)
+        except ValidationError as e:
+            self.errors.append({"row": index, "error": _validation_message(e)})
+            return
+        
+        self.pending.append((index, log))
+        if len(self.pending) >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        chunk, self.pending = self.pending, []
+        
+        directory = await get_employee_directory(self.user_id)
+        ticket_ids = list({log.ticket_id for _, log in chunk if log.ticket_id})
+        tickets = dict(zip(ticket_ids, await self.tickets.load_many(ticket_ids)))
+        
+        valid = []
+        for index, log in chunk:
+            if log.employee_id not in directory:
+                self.errors.append({"row": index, "error": "Employee not found"})
+            elif log.ticket_id and not tickets[log.ticket_id]:
+                self.errors.append({"row": index, "error": "Ticket not found"})
+            else:
+                valid.append((index, _time_log_row(log, self.user_id)))
+        
+        if not valid:
+            return
+        
+        try:
+            await self._insert([row for _, row in valid])
+        except Exception as e:
+            if not is_data_error(e):
+                raise
+            for index, row in valid:
+                try:
+                    await self._insert([row])
+                except Exception as e:
+                    if not is_data_error(e):
+                        raise
+                    self.errors.append({"row": index, "error": e.message or str(e)})
+
+    async def _insert(self, rows: list):
+        returning = "representation" if self.return_rows else "minimal"
+        response = await db.execute(db.table("employee_time_logs").insert(rows, returning=returning))
+        self.created += len(rows)
+        if self.return_rows:
+            self.rows.extend(response.data)
+
+    def result(self) -> dict:
+        result = {
+            "created": self.created,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda err: err["row"])
+        }
+        if self.return_rows:
+            result["time_logs"] = self.rows
+        return result
 
 # ============================================
 # TIME LOG CRUD ENDPOINTS
 # ============================================
 
+TIME_LOG_LIST_SELECT = "*, employees(id, name, position, department), tickets(ticket_number, title)"
+# fields= allowlist for the time log list: public field name -> select expression
+TIME_LOG_FIELDS = {
+    **{name: name for name in [
+        "id", "employee_id", "ticket_id", "description", "hours_worked", "work_date",
+        "start_time", "end_time", "is_billable", "created_at", "updated_at"
+    ]},
+    "employees": "employees(id, name, position, department)",
+    "tickets": "tickets(ticket_number, title)"
+}
+TIME_LOG_EXPORT_COLUMNS = [
+    "id", "work_date", "employee_id", "employees.name", "employees.department",
+    "ticket_id", "tickets.ticket_number", "tickets.title", "description",
+    "hours_worked", "is_billable", "start_time", "end_time", "created_at"
+]
+
+def _filter_time_logs(query, employee_id=None, ticket_id=None, start_date=None, end_date=None, is_billable=None):
+    """Filters shared by the time log list and export endpoints"""
+    if employee_id:
+        query = query.eq("employee_id", employee_id)
+    if ticket_id:
+        query = query.eq("ticket_id", ticket_id)
+    if start_date:
+        query = query.gte("work_date", start_date.isoformat())
+    if end_date:
+        query = query.lte("work_date", end_date.isoformat())
+    if is_billable is not None:
+        query = query.eq("is_billable", is_billable)
+    return query
+
 @router.get("/")
 async def list_time_logs(
     employee_id: Optional[str] = None,
@@ -47,31 +219,65 @@ async def list_time_logs(
     is_billable: Optional[bool] = None,
     limit: int = Query(100, le=500),
     offset: int = 0,
+    cursor: Optional[str] = Query(None, description="next_cursor from a previous page (takes precedence over offset)"),
+    count: Optional[str] = Query(None, pattern=COUNT_PATTERN, description="Include a total: exact, planned or estimated"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: dict = Depends(get_current_user)
 ):
     """List employee time logs with optional filtering"""
     try:
-        query = supabase.table("employee_time_logs")\
-            .select("*, employees(id, name, position, department), tickets(ticket_number, title)")\
+        columns = select_fields(fields, TIME_LOG_FIELDS, ("id", "work_date")) if fields else TIME_LOG_LIST_SELECT
+        query = db.table("employee_time_logs")\
+            .select(columns, count=count)\
             .eq("user_id", current_user.id)
+        query = _filter_time_logs(query, employee_id, ticket_id, start_date, end_date, is_billable)
+        
+        query = apply_keyset(query, "work_date", cursor)
+        if not cursor:
+            query = query.offset(offset)
         
-        if employee_id:
-            query = query.eq("employee_id", employee_id)
-        if ticket_id:
-            query = query.eq("ticket_id", ticket_id)
-        if start_date:
-            query = query.gte("work_date", start_date.isoformat())
-        if end_date:
-            query = query.lte("work_date", end_date.isoformat())
-        if is_billable is not None:
-            query = query.eq("is_billable", is_billable)
-        
-        response = query.order("work_date", desc=True)\
-            .limit(limit)\
-            .offset(offset)\
-            .execute()
-        
-        return {"time_logs": response.data, "count": len(response.data)}
+        response = await db.execute(query.limit(limit + 1))
+        time_logs, has_more, next_cursor = paginate(response.data, limit, "work_date")
+        
+        return {
+            "time_logs": time_logs,
+            "count": len(time_logs),
+            "total": response.count,
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export")
+async def export_time_logs(
+    employee_id: Optional[str] = None,
+    ticket_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    is_billable: Optional[bool] = None,
+    format: str = Query("csv", pattern=EXPORT_FORMAT_PATTERN, description="csv or ndjson"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream every matching time log as CSV or NDJSON, newest first"""
+    try:
+        def make_query():
+            query = db.table("employee_time_logs")\
+                .select(TIME_LOG_LIST_SELECT)\
+                .eq("user_id", current_user.id)
+            return _filter_time_logs(query, employee_id, ticket_id, start_date, end_date, is_billable)
+        
+        return await export_response(
+            make_query,
+            "work_date",
+            TIME_LOG_EXPORT_COLUMNS,
+            format,
+            f"time-logs-{date.today().isoformat()}"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -82,12 +288,11 @@ async def get_time_log(
 ):
     """Get a single time log entry"""
     try:
-        response = supabase.table("employee_time_logs")\
+        response = await db.execute(db.table("employee_time_logs")\
             .select("*, employees(id, name, position), tickets(ticket_number, title, status)")\
             .eq("id", log_id)\
             .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+            .single())
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Time log not found")
@@ -101,46 +306,24 @@ async def get_time_log(
 @router.post("/", status_code=201)
 async def create_time_log(
     log: TimeLogCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Create a new time log entry"""
     try:
-        # Verify employee exists
-        emp_check = supabase.table("employees")\
-            .select("id")\
-            .eq("id", log.employee_id)\
-            .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+        # Verify employee and ticket (if provided) concurrently
+        checks = [loaders.employees.load(log.employee_id)]
+        if log.ticket_id:
+            checks.append(loaders.tickets.load(log.ticket_id))
+        employee, *ticket = await asyncio.gather(*checks)
         
-        if not emp_check.data:
+        if not employee:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        # Verify ticket if provided
-        if log.ticket_id:
-            ticket_check = supabase.table("tickets")\
-                .select("id")\
-                .eq("id", log.ticket_id)\
-                .eq("user_id", current_user.id)\
-                .single()\
-                .execute()
-            
-            if not ticket_check.data:
-                raise HTTPException(status_code=404, detail="Ticket not found")
-        
-        log_data = {
-            "user_id": current_user.id,
-            "employee_id": log.employee_id,
-            "ticket_id": log.ticket_id,
-            "description": log.description,
-            "hours_worked": log.hours_worked,
-            "work_date": log.work_date.isoformat(),
-            "start_time": log.start_time.isoformat() if log.start_time else None,
-            "end_time": log.end_time.isoformat() if log.end_time else None,
-            "is_billable": log.is_billable
-        }
+        if ticket and not ticket[0]:
+            raise HTTPException(status_code=404, detail="Ticket not found")
         
-        response = supabase.table("employee_time_logs").insert(log_data).execute()
+        response = await db.execute(db.table("employee_time_logs").insert(_time_log_row(log, current_user.id)))
         
         return response.data[0]
     except HTTPException:
@@ -148,31 +331,69 @@ async def create_time_log(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/batch", status_code=201)
+# The body is read by hand (to stream NDJSON and report per-row errors), so
+# it is described for the OpenAPI schema explicitly
+TIME_LOG_BATCH_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "object",
+                    "required": ["logs"],
+                    "properties": {
+                        "logs": {"type": "array", "items": {"$ref": "#/components/schemas/TimeLogCreate"}}
+                    }
+                }
+            },
+            NDJSON_MEDIA_TYPE: {
+                "schema": {"type": "string", "description": "One TimeLogCreate object per line"}
+            }
+        }
+    }
+}
+
+@router.post("/batch", status_code=201, openapi_extra=TIME_LOG_BATCH_BODY)
 async def create_time_logs_batch(
-    batch: TimeLogBatch,
-    current_user: dict = Depends(get_current_user)
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Create multiple time log entries at once"""
+    """
+    Create multiple time log entries at once.
+
+    Accepts either a JSON body ({"logs": [...]}) or, for large imports, an
+    application/x-ndjson body with one time log object per line, which is
+    read and inserted incrementally. Rows are validated and inserted in
+    chunks; rows that fail are reported by their 0-based position and the
+    rest are still created. NDJSON imports don't echo the created rows back.
+    """
     try:
-        log_data_list = []
-        
-        for log in batch.logs:
-            log_data_list.append({
-                "user_id": current_user.id,
-                "employee_id": log.employee_id,
-                "ticket_id": log.ticket_id,
-                "description": log.description,
-                "hours_worked": log.hours_worked,
-                "work_date": log.work_date.isoformat(),
-                "start_time": log.start_time.isoformat() if log.start_time else None,
-                "end_time": log.end_time.isoformat() if log.end_time else None,
-                "is_billable": log.is_billable
-            })
+        content_type = request.headers.get("content-type", "")
+        
+        if content_type.startswith(NDJSON_MEDIA_TYPE):
+            importer = TimeLogImporter(current_user.id, loaders, return_rows=False)
+            async for index, item in _ndjson_items(request):
+                await importer.add(index, item)
+        else:
+            try:
+                body = await request.json()
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Request body must be JSON or NDJSON")
+            
+            logs = body.get("logs") if isinstance(body, dict) else None
+            if not isinstance(logs, list):
+                raise HTTPException(status_code=422, detail="Body must be an object with a 'logs' list")
+            
+            importer = TimeLogImporter(current_user.id, loaders, return_rows=True)
+            for index, item in enumerate(logs):
+                await importer.add(index, item)
         
-        response = supabase.table("employee_time_logs").insert(log_data_list).execute()
+        await importer.flush()
         
-        return {"created": len(response.data), "time_logs": response.data}
+        return importer.result()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -195,11 +416,10 @@ async def update_time_log(
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        response = supabase.table("employee_time_logs")\
+        response = await db.execute(db.table("employee_time_logs")\
             .update(update_data)\
             .eq("id", log_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Time log not found")
@@ -217,11 +437,10 @@ async def delete_time_log(
 ):
     """Delete a time log entry"""
     try:
-        response = supabase.table("employee_time_logs")\
+        response = await db.execute(db.table("employee_time_logs")\
             .delete()\
             .eq("id", log_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Time log not found")
@@ -253,76 +472,68 @@ async def review_employee_time(
         if not start_date:
             start_date = end_date - timedelta(days=30)
         
-        # Get employee info
-        emp_response = supabase.table("employees")\
-            .select("*")\
-            .eq("id", employee_id)\
-            .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+        # All four queries are tenant-scoped and independent, so run them at once
+        emp_response, logs_response, tickets_response, completed_tickets_response = await db.gather(
+            # Employee info
+            db.table("employees")\
+                .select("id, name, email, position, department, specializations, is_active")\
+                .eq("id", employee_id)\
+                .eq("user_id", current_user.id)\
+                .limit(1),
+            # Time logs for period
+            db.table("employee_time_logs")\
+                .select("id, ticket_id, description, hours_worked, work_date, start_time, end_time, is_billable, tickets(ticket_number, title, status, priority)")\
+                .eq("employee_id", employee_id)\
+                .eq("user_id", current_user.id)\
+                .gte("work_date", start_date.isoformat())\
+                .lte("work_date", end_date.isoformat())\
+                .order("work_date", desc=True),
+            # Number of tickets assigned in this period
+            db.table("tickets")\
+                .select("id", count="exact")\
+                .eq("assigned_to", employee_id)\
+                .eq("user_id", current_user.id)\
+                .gte("created_at", start_date.isoformat())\
+                .lte("created_at", end_date.isoformat())\
+                .limit(1),
+            # Tickets completed in this period
+            db.table("tickets")\
+                .select("ticket_number, title, assigned_at, completed_at, actual_hours")\
+                .eq("assigned_to", employee_id)\
+                .eq("user_id", current_user.id)\
+                .in_("status", ["resolved", "closed"])\
+                .gte("completed_at", start_date.isoformat())\
+                .lte("completed_at", end_date.isoformat())
+        )
         
         if not emp_response.data:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        employee = emp_response.data
-        
-        # Get time logs for period
-        logs_response = supabase.table("employee_time_logs")\
-            .select("*, tickets(ticket_number, title, status, priority)")\
-            .eq("employee_id", employee_id)\
-            .gte("work_date", start_date.isoformat())\
-            .lte("work_date", end_date.isoformat())\
-            .order("work_date", desc=True)\
-            .execute()
-        
+        employee = emp_response.data[0]
         logs = logs_response.data
-        
-        # Get tickets assigned in this period
-        tickets_response = supabase.table("tickets")\
-            .select("*")\
-            .eq("assigned_to", employee_id)\
-            .gte("created_at", start_date.isoformat())\
-            .lte("created_at", end_date.isoformat())\
-            .execute()
-        
-        tickets_assigned = tickets_response.data
-        
-        # Get tickets completed in this period
-        completed_tickets_response = supabase.table("tickets")\
-            .select("*")\
-            .eq("assigned_to", employee_id)\
-            .in_("status", ["resolved", "closed"])\
-            .gte("completed_at", start_date.isoformat())\
-            .lte("completed_at", end_date.isoformat())\
-            .execute()
-        
+        tickets_assigned = tickets_response.count or 0
         tickets_completed = completed_tickets_response.data
         
         # Calculate metrics
-        total_hours = sum(log["hours_worked"] for log in logs)
-        billable_hours = sum(log["hours_worked"] for log in logs if log.get("is_billable"))
+        summary = TimeLogSummary(logs, group_by=("ticket", "day"))
+        total_hours = summary.total_hours
+        billable_hours = summary.billable_hours
         
         # Group logs by ticket
-        ticket_time_map = {}
-        for log in logs:
-            if log.get("ticket_id"):
-                ticket_id = log["ticket_id"]
-                if ticket_id not in ticket_time_map:
-                    ticket_time_map[ticket_id] = {
-                        "ticket_info": log.get("tickets"),
-                        "total_hours": 0,
-                        "log_count": 0
-                    }
-                ticket_time_map[ticket_id]["total_hours"] += log["hours_worked"]
-                ticket_time_map[ticket_id]["log_count"] += 1
+        time_by_ticket = [
+            {
+                "ticket_info": bucket.first_log.get("tickets"),
+                "total_hours": bucket.hours,
+                "log_count": bucket.log_count
+            }
+            for bucket in summary.group("ticket", skip_none=True)
+        ]
         
         # Calculate completion times for completed tickets
         completion_times = []
         for ticket in tickets_completed:
-            if ticket.get("assigned_at") and ticket.get("completed_at"):
-                assigned = datetime.fromisoformat(ticket["assigned_at"].replace('Z', '+00:00'))
-                completed = datetime.fromisoformat(ticket["completed_at"].replace('Z', '+00:00'))
-                hours = (completed - assigned).total_seconds() / 3600
+            hours = hours_to_complete(ticket)
+            if hours is not None:
                 completion_times.append({
                     "ticket_number": ticket["ticket_number"],
                     "title": ticket["title"],
@@ -333,20 +544,15 @@ async def review_employee_time(
         avg_completion_time = sum(ct["hours_to_complete"] for ct in completion_times) / len(completion_times) if completion_times else 0
         
         # Daily breakdown
-        daily_hours = {}
-        for log in logs:
-            work_date = log["work_date"]
-            if work_date not in daily_hours:
-                daily_hours[work_date] = {
-                    "date": work_date,
-                    "total_hours": 0,
-                    "billable_hours": 0,
-                    "log_count": 0
-                }
-            daily_hours[work_date]["total_hours"] += log["hours_worked"]
-            if log.get("is_billable"):
-                daily_hours[work_date]["billable_hours"] += log["hours_worked"]
-            daily_hours[work_date]["log_count"] += 1
+        daily_hours = [
+            {
+                "date": bucket.key,
+                "total_hours": bucket.hours,
+                "billable_hours": bucket.billable_hours,
+                "log_count": bucket.log_count
+            }
+            for bucket in summary.group("day")
+        ]
         
         return {
             "employee": employee,
@@ -363,15 +569,15 @@ async def review_employee_time(
                 "total_logs": len(logs)
             },
             "ticket_metrics": {
-                "assigned": len(tickets_assigned),
+                "assigned": tickets_assigned,
                 "completed": len(tickets_completed),
-                "completion_rate": round((len(tickets_completed) / len(tickets_assigned) * 100) if tickets_assigned else 0, 2),
+                "completion_rate": round((len(tickets_completed) / tickets_assigned * 100) if tickets_assigned else 0, 2),
                 "avg_completion_hours": round(avg_completion_time, 2),
-                "tickets_with_time": len(ticket_time_map)
+                "tickets_with_time": len(time_by_ticket)
             },
-            "time_by_ticket": list(ticket_time_map.values()),
+            "time_by_ticket": time_by_ticket,
             "completed_tickets": completion_times,
-            "daily_breakdown": sorted(daily_hours.values(), key=lambda x: x["date"], reverse=True),
+            "daily_breakdown": sorted(daily_hours, key=lambda x: x["date"], reverse=True),
             "recent_logs": logs[:20]
         }
     except HTTPException:
@@ -387,12 +593,11 @@ async def review_ticket_time(
     """Review all time logs for a specific ticket"""
     try:
         # Get ticket info
-        ticket_response = supabase.table("tickets")\
+        ticket_response = await db.execute(db.table("tickets")\
             .select("*, employees(name, position)")\
             .eq("id", ticket_id)\
             .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+            .single())
         
         if not ticket_response.data:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -400,29 +605,26 @@ async def review_ticket_time(
         ticket = ticket_response.data
         
         # Get all time logs for this ticket
-        logs_response = supabase.table("employee_time_logs")\
+        logs_response = await db.execute(db.table("employee_time_logs")\
             .select("*, employees(name, position, department)")\
             .eq("ticket_id", ticket_id)\
-            .order("work_date", desc=False)\
-            .execute()
+            .order("work_date", desc=False))
         
         logs = logs_response.data
         
-        total_hours = sum(log["hours_worked"] for log in logs)
+        summary = TimeLogSummary(logs, group_by=("employee",))
+        total_hours = summary.total_hours
         estimated_hours = ticket.get("estimated_hours", 0) or 0
         
         # Group by employee
-        employee_hours = {}
-        for log in logs:
-            emp_id = log["employee_id"]
-            if emp_id not in employee_hours:
-                employee_hours[emp_id] = {
-                    "employee": log.get("employees"),
-                    "hours": 0,
-                    "log_count": 0
-                }
-            employee_hours[emp_id]["hours"] += log["hours_worked"]
-            employee_hours[emp_id]["log_count"] += 1
+        by_employee = [
+            {
+                "employee": bucket.first_log.get("employees"),
+                "hours": bucket.hours,
+                "log_count": bucket.log_count
+            }
+            for bucket in summary.group("employee")
+        ]
         
         return {
             "ticket": ticket,
@@ -433,7 +635,7 @@ async def review_ticket_time(
                 "variance_percentage": round(((total_hours - estimated_hours) / estimated_hours * 100) if estimated_hours > 0 else 0, 2),
                 "total_logs": len(logs)
             },
-            "by_employee": list(employee_hours.values()),
+            "by_employee": by_employee,
             "time_logs": logs
         }
     except HTTPException:
@@ -441,6 +643,42 @@ async def review_ticket_time(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# employee_time_daily's primary key, less user_id
+ROLLUP_KEY_COLUMNS = ("work_date", "employee_id", "is_billable")
+
+async def _summarize_period(user_id: str, start_date: date, end_date: date, columns: str = "", group_by=()):
+    """
+    Summarize a period from the employee_time_daily rollup (one row per
+    employee, day and billable flag), falling back to raw time logs if the
+    rollup table isn't there. `columns` are extra columns or embeds to read
+    alongside work_date, employee_id and is_billable, each with a leading
+    comma.
+    """
+    def rollup_query():
+        return db.table("employee_time_daily")\
+            .select(f"work_date, employee_id, is_billable, total_hours, log_count{columns}")\
+            .eq("user_id", user_id)\
+            .gte("work_date", start_date.isoformat())\
+            .lte("work_date", end_date.isoformat())
+    
+    def logs_query():
+        return db.table("employee_time_logs")\
+            .select(f"id, work_date, employee_id, is_billable, hours_worked{columns}")\
+            .eq("user_id", user_id)\
+            .gte("work_date", start_date.isoformat())\
+            .lte("work_date", end_date.isoformat())
+    
+    try:
+        # Paged in primary key order: a long period has more rows than max-rows
+        rows = await read_all(rollup_query, ROLLUP_KEY_COLUMNS)
+    except Exception as e:
+        # Only a missing rollup falls back; a slow one must not trigger a raw scan
+        if not is_missing_relation(e):
+            raise
+        return TimeLogSummary(await read_all(logs_query, ("id",)), group_by)
+    
+    return TimeLogSummary.from_rollup(rows, group_by)
+
 @router.get("/stats/summary")
 async def get_time_stats_summary(
     start_date: Optional[date] = None,
@@ -454,36 +692,28 @@ async def get_time_stats_summary(
         if not start_date:
             start_date = end_date - timedelta(days=30)
         
-        # Get all time logs for period
-        logs_response = supabase.table("employee_time_logs")\
-            .select("*, employees(name, department)")\
-            .eq("user_id", current_user.id)\
-            .gte("work_date", start_date.isoformat())\
-            .lte("work_date", end_date.isoformat())\
-            .execute()
-        
-        logs = logs_response.data
-        
-        total_hours = sum(log["hours_worked"] for log in logs)
-        billable_hours = sum(log["hours_worked"] for log in logs if log.get("is_billable"))
+        summary = await _summarize_period(
+            current_user.id,
+            start_date,
+            end_date,
+            ", employees(name, department)",
+            group_by=("employee", "department")
+        )
+        total_hours = summary.total_hours
+        billable_hours = summary.billable_hours
         
         # By employee
-        employee_hours = {}
-        for log in logs:
-            emp_id = log["employee_id"]
-            if emp_id not in employee_hours:
-                employee_hours[emp_id] = {
-                    "employee_name": log.get("employees", {}).get("name", "Unknown"),
-                    "department": log.get("employees", {}).get("department"),
-                    "hours": 0
-                }
-            employee_hours[emp_id]["hours"] += log["hours_worked"]
+        employee_hours = []
+        for bucket in summary.group("employee"):
+            employee = bucket.first_log.get("employees") or {}
+            employee_hours.append({
+                "employee_name": employee.get("name", "Unknown"),
+                "department": employee.get("department"),
+                "hours": bucket.hours
+            })
         
         # By department
-        dept_hours = {}
-        for log in logs:
-            dept = log.get("employees", {}).get("department", "Unassigned")
-            dept_hours[dept] = dept_hours.get(dept, 0) + log["hours_worked"]
+        dept_hours = {bucket.key: bucket.hours for bucket in summary.group("department")}
         
         return {
             "period": {
@@ -496,17 +726,37 @@ async def get_time_stats_summary(
                 "billable_hours": round(billable_hours, 2),
                 "non_billable_hours": round(total_hours - billable_hours, 2),
                 "billable_percentage": round((billable_hours / total_hours * 100) if total_hours > 0 else 0, 2),
-                "total_logs": len(logs)
+                "total_logs": summary.log_count
             },
-            "by_employee": sorted(employee_hours.values(), key=lambda x: x["hours"], reverse=True),
+            "by_employee": sorted(employee_hours, key=lambda x: x["hours"], reverse=True),
             "by_department": [{"department": k, "hours": round(v, 2)} for k, v in sorted(dept_hours.items(), key=lambda x: x[1], reverse=True)]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+BREAKDOWN_PATTERN = "^(employee|department)$"
+
+def _describe_breakdown(breakdown: str):
+    def describe(bucket):
+        employee = bucket.first_log.get("employees") or {}
+        row = {"department": employee.get("department") or "Unassigned"} if breakdown == "department" else {
+            "employee_id": bucket.first_log["employee_id"],
+            "employee_name": employee.get("name", "Unknown"),
+            "department": employee.get("department")
+        }
+        row.update({
+            "total_hours": round(bucket.hours, 2),
+            "billable_hours": round(bucket.billable_hours, 2),
+            "log_count": bucket.log_count
+        })
+        return row
+    return describe
+
 @router.get("/stats/trends")
 async def get_time_trends(
     days: int = Query(30, ge=7, le=365),
+    granularity: str = Query("day", pattern=GRANULARITY_PATTERN, description="Bucket size: day, week or month"),
+    breakdown: Optional[str] = Query(None, pattern=BREAKDOWN_PATTERN, description="Split each bucket by employee or department"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get time logging trends over specified period"""
@@ -514,43 +764,31 @@ async def get_time_trends(
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
         
-        logs_response = supabase.table("employee_time_logs")\
-            .select("work_date, hours_worked, is_billable")\
-            .eq("user_id", current_user.id)\
-            .gte("work_date", start_date.isoformat())\
-            .lte("work_date", end_date.isoformat())\
-            .execute()
+        group_by = (granularity, (granularity, breakdown)) if breakdown else (granularity,)
+        columns = ", employees(name, department)" if breakdown else ""
+        summary = await _summarize_period(current_user.id, start_date, end_date, columns, group_by)
         
-        logs = logs_response.data
-        
-        # Daily aggregation
-        daily_data = {}
-        current = start_date
-        while current <= end_date:
-            daily_data[current.isoformat()] = {
-                "date": current.isoformat(),
-                "total_hours": 0,
-                "billable_hours": 0,
-                "log_count": 0
-            }
-            current += timedelta(days=1)
+        trends = period_series(
+            summary,
+            start_date,
+            end_date,
+            granularity,
+            breakdown,
+            _describe_breakdown(breakdown) if breakdown else None
+        )
         
-        for log in logs:
-            date_key = log["work_date"]
-            if date_key in daily_data:
-                daily_data[date_key]["total_hours"] += log["hours_worked"]
-                if log.get("is_billable"):
-                    daily_data[date_key]["billable_hours"] += log["hours_worked"]
-                daily_data[date_key]["log_count"] += 1
-        
-        return {
+        response = {
             "period": {
                 "start_date": start_date.isoformat(),
                 "end_date": end_date.isoformat(),
                 "days": days
             },
-            "daily_trends": sorted(daily_data.values(), key=lambda x: x["date"])
+            "granularity": granularity,
+            "trends": trends
         }
+        if granularity == "day":
+            # Kept for clients written before granularity was added
+            response["daily_trends"] = trends
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
@@ -1,11 +1,21 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime, date, timedelta
-from config.supabase_client import supabase
+from config.database import db, is_missing_relation
+from services.cache import ticket_stats_cache, ticket_stats_changed
+from services.events import event_hub
+from services.changes import changes_since
+from services.pagination import COUNT_PATTERN, apply_keyset, paginate
+from services.directory import get_employee_directory, invalidate_employee_directory
+from services.loaders import Loaders, get_loaders
+from services.fieldsets import FIELDS_DESCRIPTION, select_fields
+from services.time_aggregation import TimeLogSummary, hours_to_complete
+from middleware.responses import FastJSONRoute
 from middleware.auth import get_current_user
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 # ============================================
 # PYDANTIC MODELS
@@ -37,17 +47,34 @@ class EmployeeUpdate(BaseModel):
 # EMPLOYEE CRUD ENDPOINTS
 # ============================================
 
+EMPLOYEE_DETAIL_COLUMNS = 'id, name, email, position, department, phone, salary, specializations, avatar_url, is_active, created_at, updated_at'
+# fields= allowlists: public field name -> select expression
+EMPLOYEE_FIELDS = {name: name for name in EMPLOYEE_DETAIL_COLUMNS.split(', ')}
+PERFORMANCE_TICKET_FIELDS = {
+    name: name for name in [
+        'id', 'ticket_number', 'title', 'description', 'status', 'priority', 'category_id',
+        'assigned_to', 'reported_by', 'reporter_email', 'due_date', 'estimated_hours',
+        'actual_hours', 'tags', 'created_at', 'updated_at', 'assigned_at', 'completed_at'
+    ]
+}
+RECENT_TIME_LOG_COLUMNS = 'id, ticket_id, description, hours_worked, work_date, start_time, end_time, is_billable, created_at'
+
 @router.get("/")
 async def get_employees(
     department: Optional[str] = None,
     is_active: Optional[bool] = None,
     search: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from a previous page"),
+    count: Optional[str] = Query(None, pattern=COUNT_PATTERN, description="Include a total: exact, planned or estimated"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     user=Depends(get_current_user)
 ):
-    """Get all employees with optional filtering"""
+    """Get all employees with optional filtering (paged when limit is given)"""
     try:
-        query = supabase.table('employees')\
-            .select('*')\
+        columns = select_fields(fields, EMPLOYEE_FIELDS, ('id', 'created_at')) if fields else '*'
+        query = db.table('employees')\
+            .select(columns, count=count)\
             .eq('user_id', user.id)
         
         if department:
@@ -57,46 +84,76 @@ async def get_employees(
         if search:
             query = query.or_(f"name.ilike.%{search}%,email.ilike.%{search}%,position.ilike.%{search}%")
         
-        response = query.order('created_at', desc=True).execute()
+        query = apply_keyset(query, 'created_at', cursor)
+        if limit:
+            query = query.limit(limit + 1)
+        
+        response = await db.execute(query)
+        employees, has_more, next_cursor = paginate(response.data, limit, 'created_at')
         
-        return {"employees": response.data, "count": len(response.data)}
+        return {
+            "employees": employees,
+            "count": len(employees),
+            "total": response.count,
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch employees: {str(e)}")
 
+@router.get("/changes")
+async def get_employee_changes(
+    since: Optional[str] = Query(None, description="Watermark from the previous call; omit for a full snapshot"),
+    user=Depends(get_current_user)
+):
+    """Employees created or updated after the watermark, tombstones for deleted ones, and the next watermark"""
+    try:
+        changes = await changes_since('employees', 'employees', user.id, since)
+        return {
+            "employees": changes["changed"],
+            "deleted": changes["deleted"],
+            "watermark": changes["watermark"],
+            "has_more": changes["has_more"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch employee changes: {str(e)}")
+
 @router.get("/{employee_id}")
 async def get_employee(employee_id: str, user=Depends(get_current_user)):
     """Get a single employee by ID with detailed information"""
     try:
-        response = supabase.table('employees')\
-            .select('*')\
-            .eq('id', employee_id)\
-            .eq('user_id', user.id)\
-            .single()\
-            .execute()
+        # Every query is tenant-scoped, so all three can run at once
+        response, tickets_response, time_logs_response = await db.gather(
+            db.table('employees')\
+                .select(EMPLOYEE_DETAIL_COLUMNS)\
+                .eq('id', employee_id)\
+                .eq('user_id', user.id)\
+                .limit(1),
+            # Assigned tickets
+            db.table('tickets')\
+                .select('id, ticket_number, title, status, priority, created_at, due_date')\
+                .eq('assigned_to', employee_id)\
+                .eq('user_id', user.id)\
+                .order('created_at', desc=True)\
+                .limit(50),
+            # Recent time logs
+            db.table('employee_time_logs')\
+                .select(RECENT_TIME_LOG_COLUMNS)\
+                .eq('employee_id', employee_id)\
+                .eq('user_id', user.id)\
+                .order('work_date', desc=True)\
+                .limit(20)
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        employee = response.data
-        
-        # Get assigned tickets
-        tickets_response = supabase.table('tickets')\
-            .select('id, ticket_number, title, status, priority, created_at, due_date')\
-            .eq('assigned_to', employee_id)\
-            .order('created_at', desc=True)\
-            .limit(50)\
-            .execute()
-        
+        employee = response.data[0]
         employee["assigned_tickets"] = tickets_response.data
-        
-        # Get recent time logs
-        time_logs_response = supabase.table('employee_time_logs')\
-            .select('*')\
-            .eq('employee_id', employee_id)\
-            .order('work_date', desc=True)\
-            .limit(20)\
-            .execute()
-        
         employee["recent_time_logs"] = time_logs_response.data
         
         return employee
@@ -109,7 +166,7 @@ async def get_employee(employee_id: str, user=Depends(get_current_user)):
 async def create_employee(employee: EmployeeCreate, user=Depends(get_current_user)):
     """Create a new employee"""
     try:
-        response = supabase.table('employees')\
+        response = await db.execute(db.table('employees')\
             .insert({
                 'name': employee.name,
                 'email': employee.email,
@@ -121,8 +178,10 @@ async def create_employee(employee: EmployeeCreate, user=Depends(get_current_use
                 'avatar_url': employee.avatar_url,
                 'is_active': employee.is_active,
                 'user_id': user.id
-            })\
-            .execute()
+            }))
+        
+        invalidate_employee_directory(user.id)
+        event_hub.publish(user.id, "employee.created", response.data[0])
         
         return response.data[0]
     except Exception as e:
@@ -139,15 +198,17 @@ async def update_employee(employee_id: str, employee: EmployeeUpdate, user=Depen
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        response = supabase.table('employees')\
+        response = await db.execute(db.table('employees')\
             .update(update_data)\
             .eq('id', employee_id)\
-            .eq('user_id', user.id)\
-            .execute()
+            .eq('user_id', user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Employee not found")
         
+        invalidate_employee_directory(user.id)
+        event_hub.publish(user.id, "employee.updated", response.data[0])
+        
         return response.data[0]
     except HTTPException:
         raise
@@ -159,11 +220,10 @@ async def delete_employee(employee_id: str, user=Depends(get_current_user)):
     """Delete an employee"""
     try:
         # Check if employee has assigned tickets
-        tickets_check = supabase.table('tickets')\
+        tickets_check = await db.execute(db.table('tickets')\
             .select('id')\
             .eq('assigned_to', employee_id)\
-            .neq('status', 'closed')\
-            .execute()
+            .neq('status', 'closed'))
         
         if tickets_check.data:
             raise HTTPException(
@@ -171,15 +231,20 @@ async def delete_employee(employee_id: str, user=Depends(get_current_user)):
                 detail=f"Cannot delete employee with {len(tickets_check.data)} active assigned ticket(s)"
             )
         
-        response = supabase.table('employees')\
+        response = await db.execute(db.table('employees')\
             .delete()\
             .eq('id', employee_id)\
-            .eq('user_id', user.id)\
-            .execute()
+            .eq('user_id', user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Employee not found")
         
+        # Their closed tickets just became unassigned
+        ticket_stats_changed(user.id)
+        ticket_stats_cache.invalidate(user.id)
+        invalidate_employee_directory(user.id)
+        event_hub.publish(user.id, "employee.deleted", {"id": employee_id})
+        
         return {"message": "Employee deleted successfully"}
     except HTTPException:
         raise
@@ -194,32 +259,27 @@ async def delete_employee(employee_id: str, user=Depends(get_current_user)):
 async def get_employee_tickets(
     employee_id: str,
     status: Optional[str] = None,
-    user=Depends(get_current_user)
+    user=Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all tickets assigned to an employee"""
     try:
         # Verify employee exists
-        emp_check = supabase.table('employees')\
-            .select('id, name')\
-            .eq('id', employee_id)\
-            .eq('user_id', user.id)\
-            .single()\
-            .execute()
-        
-        if not emp_check.data:
+        employee = await loaders.employees.load(employee_id)
+        if not employee:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        query = supabase.table('ticket_summary')\
+        query = db.table('ticket_summary')\
             .select('*')\
             .eq('employee_id', employee_id)
         
         if status:
             query = query.eq('status', status)
         
-        response = query.order('created_at', desc=True).execute()
+        response = await db.execute(query.order('created_at', desc=True))
         
         return {
-            "employee": emp_check.data,
+            "employee": {"id": employee["id"], "name": employee["name"]},
             "tickets": response.data,
             "count": len(response.data)
         }
@@ -235,11 +295,11 @@ async def get_employee_workload(
 ):
     """Get detailed workload information for an employee"""
     try:
-        response = supabase.table('employee_workload')\
+        response = await db.execute(db.table('employee_workload')\
             .select('*')\
             .eq('employee_id', employee_id)\
-            .single()\
-            .execute()
+            .eq('user_id', user.id)\
+            .single())
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Employee not found")
@@ -254,69 +314,65 @@ async def get_employee_workload(
 async def get_employee_performance(
     employee_id: str,
     days: int = Query(30, ge=1, le=365),
+    fields: Optional[str] = Query(None, description="Comma-separated fields for recent_tickets (default: all)"),
     user=Depends(get_current_user)
 ):
     """Get employee performance metrics for the specified period"""
     try:
         # Verify employee
-        emp_check = supabase.table('employees')\
+        emp_check = await db.execute(db.table('employees')\
             .select('id, name, position, department, specializations')\
             .eq('id', employee_id)\
             .eq('user_id', user.id)\
-            .single()\
-            .execute()
+            .single())
         
         if not emp_check.data:
             raise HTTPException(status_code=404, detail="Employee not found")
         
         start_date = (datetime.now() - timedelta(days=days)).date()
         
-        # Get tickets
-        tickets_response = supabase.table('tickets')\
-            .select('*')\
+        # Get tickets (the metrics always need status, priority and timestamps)
+        ticket_columns = select_fields(
+            fields,
+            PERFORMANCE_TICKET_FIELDS,
+            ('id', 'status', 'priority', 'assigned_at', 'completed_at')
+        ) if fields else '*'
+        tickets_response = await db.execute(db.table('tickets')\
+            .select(ticket_columns)\
             .eq('assigned_to', employee_id)\
             .gte('created_at', start_date.isoformat())\
-            .execute()
+            .order('created_at', desc=True))
         
         tickets = tickets_response.data
         
         # Get time logs
-        time_logs_response = supabase.table('employee_time_logs')\
-            .select('*')\
+        time_logs_response = await db.execute(db.table('employee_time_logs')\
+            .select('hours_worked, is_billable')\
             .eq('employee_id', employee_id)\
-            .gte('work_date', start_date.isoformat())\
-            .execute()
+            .gte('work_date', start_date.isoformat()))
         
         time_logs = time_logs_response.data
         
-        # Calculate metrics
+        # Calculate metrics in one pass over tickets
         total_tickets = len(tickets)
-        completed_tickets = len([t for t in tickets if t['status'] in ['resolved', 'closed']])
-        active_tickets = len([t for t in tickets if t['status'] not in ['resolved', 'closed']])
-        
-        total_hours = sum(log['hours_worked'] for log in time_logs)
-        billable_hours = sum(log['hours_worked'] for log in time_logs if log.get('is_billable'))
-        
-        # Calculate average completion time
-        completed_with_times = [
-            t for t in tickets 
-            if t['status'] in ['resolved', 'closed'] and t.get('assigned_at') and t.get('completed_at')
-        ]
-        
-        avg_completion_hours = 0
-        if completed_with_times:
-            total_completion_time = 0
-            for t in completed_with_times:
-                assigned = datetime.fromisoformat(t['assigned_at'].replace('Z', '+00:00'))
-                completed = datetime.fromisoformat(t['completed_at'].replace('Z', '+00:00'))
-                total_completion_time += (completed - assigned).total_seconds() / 3600
-            avg_completion_hours = total_completion_time / len(completed_with_times)
-        
-        # Priority breakdown
+        completed_tickets = 0
+        completion_hours = []
         priority_counts = {}
         for ticket in tickets:
+            if ticket['status'] in ('resolved', 'closed'):
+                completed_tickets += 1
+                hours = hours_to_complete(ticket)
+                if hours is not None:
+                    completion_hours.append(hours)
             priority = ticket.get('priority', 'medium')
             priority_counts[priority] = priority_counts.get(priority, 0) + 1
+        active_tickets = total_tickets - completed_tickets
+        
+        summary = TimeLogSummary(time_logs)
+        total_hours = summary.total_hours
+        billable_hours = summary.billable_hours
+        
+        avg_completion_hours = sum(completion_hours) / len(completion_hours) if completion_hours else 0
         
         return {
             "employee": emp_check.data,
@@ -353,17 +409,9 @@ async def get_employee_performance(
 async def list_specializations(user=Depends(get_current_user)):
     """Get all unique specializations across all employees"""
     try:
-        response = supabase.table('employees')\
-            .select('specializations')\
-            .eq('user_id', user.id)\
-            .execute()
-        
-        all_specs = set()
-        for emp in response.data:
-            if emp.get('specializations'):
-                all_specs.update(emp['specializations'])
+        directory = await get_employee_directory(user.id)
         
-        return {"specializations": sorted(list(all_specs))}
+        return {"specializations": directory.specializations}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -374,16 +422,17 @@ async def get_employees_by_specialization(
 ):
     """Get all employees with a specific specialization"""
     try:
-        response = supabase.table('employees')\
-            .select('*')\
-            .eq('user_id', user.id)\
-            .execute()
-        
-        # Filter employees with matching specialization
-        matching_employees = [
-            emp for emp in response.data
-            if emp.get('specializations') and specialization.lower() in [s.lower() for s in emp['specializations']]
-        ]
+        # Case-insensitive lookup in the cached directory's specialization index
+        directory = await get_employee_directory(user.id)
+        employee_ids = directory.with_specialization(specialization)
+        
+        matching_employees = []
+        if employee_ids:
+            response = await db.execute(db.table('employees')\
+                .select('*')\
+                .eq('user_id', user.id)\
+                .in_('id', employee_ids))
+            matching_employees = response.data
         
         return {"specialization": specialization, "employees": matching_employees, "count": len(matching_employees)}
     except Exception as e:
@@ -397,17 +446,94 @@ async def get_employees_by_specialization(
 async def list_departments(user=Depends(get_current_user)):
     """Get all unique departments"""
     try:
-        response = supabase.table('employees')\
-            .select('department')\
-            .eq('user_id', user.id)\
-            .execute()
+        directory = await get_employee_directory(user.id)
         
-        departments = set(emp['department'] for emp in response.data if emp.get('department'))
+        departments = set(emp['department'] for emp in directory.values() if emp.get('department'))
         
         return {"departments": sorted(list(departments))}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+DEPARTMENT_TICKET_COUNT_COLUMNS = 'department, status, ticket_count'
+
+async def _department_ticket_counts(user_id: str, department: str = None, directory: dict = None):
+    """Ticket counts per (department, status) for the user's assigned tickets"""
+    query = db.table('department_ticket_counts')\
+        .select(DEPARTMENT_TICKET_COUNT_COLUMNS)\
+        .eq('user_id', user_id)
+    if department is not None:
+        query = query.eq('department', department)
+    try:
+        response = await db.execute(query)
+        return response.data
+    except Exception as e:
+        if not is_missing_relation(e):
+            raise
+        # View not deployed yet - group raw ticket rows by assignee department
+        if directory is None:
+            directory = await get_employee_directory(user_id)
+        response = await db.execute(db.table('tickets')\
+            .select('assigned_to, status')\
+            .eq('user_id', user_id))
+        
+        counts = {}
+        for ticket in response.data:
+            employee = directory.get(ticket['assigned_to']) if ticket['assigned_to'] else None
+            if employee is None or (department is not None and employee.get('department') != department):
+                continue
+            key = (employee.get('department'), ticket['status'])
+            counts[key] = counts.get(key, 0) + 1
+        return [
+            {"department": dept, "status": status, "ticket_count": count}
+            for (dept, status), count in counts.items()
+        ]
+
+def _empty_department_stats(department: str, employee_count: int = 0) -> dict:
+    return {
+        "department": department,
+        "employee_count": employee_count,
+        "total_tickets": 0,
+        "active_tickets": 0,
+        "completed_tickets": 0
+    }
+
+def _add_ticket_counts(stats: dict, status: str, count: int):
+    stats["total_tickets"] += count
+    if status in ('resolved', 'closed'):
+        stats["completed_tickets"] += count
+    else:
+        stats["active_tickets"] += count
+
+@router.get("/departments/stats")
+async def get_all_department_stats(user=Depends(get_current_user)):
+    """Get employee and ticket statistics for every department"""
+    try:
+        directory = await get_employee_directory(user.id)
+        rows = await _department_ticket_counts(user.id, directory=directory)
+        
+        departments = {}
+        for emp in directory.values():
+            if emp.get('department'):
+                stats = departments.get(emp['department'])
+                if stats is None:
+                    stats = departments[emp['department']] = _empty_department_stats(emp['department'])
+                    stats["tickets_by_status"] = {}
+                stats["employee_count"] += 1
+        
+        for row in rows:
+            stats = departments.get(row['department'])
+            if stats is None:
+                continue
+            stats["tickets_by_status"][row['status']] = row['ticket_count']
+            _add_ticket_counts(stats, row['status'], row['ticket_count'])
+        
+        return {
+            "departments": [departments[name] for name in sorted(departments)],
+            "total_departments": len(departments)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/departments/{department}/stats")
 async def get_department_stats(
     department: str,
@@ -415,40 +541,25 @@ async def get_department_stats(
 ):
     """Get statistics for a specific department"""
     try:
-        # Get employees in department
-        emp_response = supabase.table('employees')\
-            .select('id, name, position')\
-            .eq('user_id', user.id)\
-            .eq('department', department)\
-            .execute()
+        # Roster and grouped ticket counts are independent lookups
+        emp_response, rows = await asyncio.gather(
+            db.execute(db.table('employees')\
+                .select('id, name, position')\
+                .eq('user_id', user.id)\
+                .eq('department', department)),
+            _department_ticket_counts(user.id, department)
+        )
         
         employees = emp_response.data
-        employee_ids = [emp['id'] for emp in employees]
-        
-        if not employee_ids:
-            return {
-                "department": department,
-                "employee_count": 0,
-                "total_tickets": 0,
-                "active_tickets": 0,
-                "completed_tickets": 0
-            }
-        
-        # Get tickets for department employees
-        tickets_response = supabase.table('tickets')\
-            .select('status')\
-            .in_('assigned_to', employee_ids)\
-            .execute()
         
-        tickets = tickets_response.data
+        if not employees:
+            return _empty_department_stats(department)
         
-        return {
-            "department": department,
-            "employee_count": len(employees),
-            "employees": employees,
-            "total_tickets": len(tickets),
-            "active_tickets": len([t for t in tickets if t['status'] not in ['resolved', 'closed']]),
-            "completed_tickets": len([t for t in tickets if t['status'] in ['resolved', 'closed']])
-        }
+        stats = _empty_department_stats(department, len(employees))
+        stats["employees"] = employees
+        for row in rows:
+            _add_ticket_counts(stats, row['status'], row['ticket_count'])
+        
+        return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import asyncio
+import secrets
+import jwt
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from types import SimpleNamespace
+from typing import Optional
+from middleware.responses import FastJSONRoute
+from middleware.auth import authenticate, get_current_user
+from services.cache import TTLCache
+from services.events import event_hub
+
+router = APIRouter(route_class=FastJSONRoute)
+
+# Comment line sent on idle connections so proxies don't close them
+KEEPALIVE_SECONDS = 15
+
+# Stream tokens stand in for the access token in the EventSource URL (which
+# ends up in access logs), so they are short-lived and single-use.
+STREAM_TOKEN_TTL_SECONDS = int(os.getenv("STREAM_TOKEN_TTL_SECONDS", "30"))
+# Set it when running several workers so any of them can verify a token
+STREAM_TOKEN_SECRET = os.getenv("STREAM_TOKEN_SECRET") or secrets.token_urlsafe(32)
+STREAM_TOKEN_AUDIENCE = "event-stream"
+
+# Ids of redeemed stream tokens, kept until the tokens would have expired
+redeemed_stream_tokens = TTLCache(maxsize=100000, ttl=STREAM_TOKEN_TTL_SECONDS)
+
+# ============================================
+# SERVER-SENT EVENTS
+# ============================================
+
+def _redeem_stream_token(token: str):
+    try:
+        claims = jwt.decode(
+            token,
+            STREAM_TOKEN_SECRET,
+            algorithms=["HS256"],
+            audience=STREAM_TOKEN_AUDIENCE,
+            options={"require": ["exp", "sub", "jti"]}
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream token")
+    
+    # Single use within a worker; the short expiry bounds replay across workers
+    if redeemed_stream_tokens.get(claims["jti"]) is not None:
+        raise HTTPException(status_code=401, detail="Stream token already used")
+    redeemed_stream_tokens.set(claims["jti"], True)
+    
+    return SimpleNamespace(id=claims["sub"], email=claims.get("email"))
+
+@router.post("/token")
+async def create_stream_token(user=Depends(get_current_user)):
+    """Issue a short-lived, single-use token for opening the event stream"""
+    now = int(time.time())
+    token = jwt.encode({
+        "sub": user.id,
+        "email": user.email,
+        "aud": STREAM_TOKEN_AUDIENCE,
+        "iat": now,
+        "exp": now + STREAM_TOKEN_TTL_SECONDS,
+        "jti": secrets.token_urlsafe(16)
+    }, STREAM_TOKEN_SECRET, algorithm="HS256")
+    
+    return {"token": token, "expires_in": STREAM_TOKEN_TTL_SECONDS}
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = Query(None, description="Single-use token from POST /api/stream/token (EventSource can't send headers)"),
+    authorization: str = Header(None)
+):
+    """
+    Push ticket and employee change events for the current user as
+    Server-Sent Events. Event types look like `ticket.updated`; a `resync`
+    event means events were dropped and the client should refetch.
+    """
+    if authorization and authorization.startswith('Bearer '):
+        user = await authenticate(authorization.split(' ')[1])
+    elif token:
+        user = _redeem_stream_token(token)
+    else:
+        raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
+    
+    async def event_source():
+        try:
+            # Subscribed only once the body starts, so the finally below
+            # always runs for it, even if the client left before then
+            queue = event_hub.subscribe(user.id)
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            event_hub.unsubscribe(user.id, queue)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
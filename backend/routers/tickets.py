@@ -1,11 +1,23 @@
+import re
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime, date
+from middleware.responses import FastJSONRoute
 from middleware.auth import get_current_user
-from config.supabase_client import supabase
+from config.database import db, is_missing_function, is_missing_relation
+from services.cache import ticket_stats_cache, ticket_stats_changed, ticket_stats_versions
+from services.pagination import COUNT_PATTERN, apply_keyset, paginate
+from services.export import EXPORT_FORMAT_PATTERN, export_response
+from services.directory import get_categories, invalidate_categories
+from services.loaders import Loaders, get_loaders
+from services.fieldsets import FIELDS_DESCRIPTION, select_fields
+from services.recommendations import CandidatePool
+from services.events import event_hub
+from services.changes import changes_since
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 # ============================================
 # PYDANTIC MODELS
@@ -52,6 +64,11 @@ class TicketUpdate(BaseModel):
 class TicketAssign(BaseModel):
     assigned_to: Optional[str] = None  # employee_id or null to unassign
 
+class BulkRecommendationRequest(BaseModel):
+    ticket_ids: Optional[List[str]] = None  # omit for every open, unassigned ticket
+    limit: int = Field(5, ge=1, le=20)
+    plan_assignments: bool = False  # also propose a load-balanced assignment
+
 class CommentCreate(BaseModel):
     content: str
     is_internal: bool = False
@@ -59,6 +76,24 @@ class CommentCreate(BaseModel):
 class CommentUpdate(BaseModel):
     content: str
 
+TICKET_STATUSES = ["open", "in_progress", "in_review", "resolved", "closed", "blocked"]
+TICKET_PRIORITIES = ["urgent", "high", "medium", "low"]
+
+# Most tickets scored by one bulk recommendation request
+MAX_BULK_RECOMMENDATIONS = 200
+
+# Greedy assignment hands out the most pressing tickets first
+PRIORITY_RANK = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
+
+# Ticket numbers look like TICK-0042; searches for one skip text matching
+TICKET_NUMBER_RE = re.compile(r"^TICK-\d+$", re.IGNORECASE)
+
+# Columns returned by ticket search results
+SEARCH_RESULT_COLUMNS = "id, ticket_number, title, status, priority, category_name, employee_id, employee_name, created_at"
+
+# Optional sections embedded by GET /{ticket_id}
+TICKET_DETAIL_SECTIONS = {"comments", "history", "watchers"}
+
 # ============================================
 # TICKET CATEGORY ENDPOINTS
 # ============================================
@@ -67,13 +102,7 @@ class CommentUpdate(BaseModel):
 async def list_categories(current_user: dict = Depends(get_current_user)):
     """List all ticket categories"""
     try:
-        response = supabase.table("ticket_categories")\
-            .select("*")\
-            .eq("user_id", current_user.id)\
-            .order("name")\
-            .execute()
-        
-        return {"categories": response.data}
+        return {"categories": await get_categories(current_user.id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -84,13 +113,16 @@ async def create_category(
 ):
     """Create a new ticket category"""
     try:
-        response = supabase.table("ticket_categories").insert({
+        response = await db.execute(db.table("ticket_categories").insert({
             "user_id": current_user.id,
             "name": category.name,
             "description": category.description,
             "color": category.color,
             "icon": category.icon
-        }).execute()
+        }))
+        
+        invalidate_categories(current_user.id)
+        event_hub.publish(current_user.id, "category.created", response.data[0])
         
         return response.data[0]
     except Exception as e:
@@ -111,15 +143,18 @@ async def update_category(
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        response = supabase.table("ticket_categories")\
+        response = await db.execute(db.table("ticket_categories")\
             .update(update_data)\
             .eq("id", category_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Category not found")
         
+        _invalidate_ticket_stats(current_user.id)
+        invalidate_categories(current_user.id)
+        event_hub.publish(current_user.id, "category.updated", response.data[0])
+        
         return response.data[0]
     except HTTPException:
         raise
@@ -133,15 +168,18 @@ async def delete_category(
 ):
     """Delete a ticket category"""
     try:
-        response = supabase.table("ticket_categories")\
+        response = await db.execute(db.table("ticket_categories")\
             .delete()\
             .eq("id", category_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Category not found")
         
+        _invalidate_ticket_stats(current_user.id)
+        invalidate_categories(current_user.id)
+        event_hub.publish(current_user.id, "category.deleted", {"id": category_id})
+        
         return {"message": "Category deleted successfully"}
     except HTTPException:
         raise
@@ -152,6 +190,40 @@ async def delete_category(
 # TICKET ENDPOINTS
 # ============================================
 
+# fields= allowlist for the ticket list (ticket_summary columns)
+TICKET_SUMMARY_FIELDS = {
+    name: name for name in [
+        "id", "ticket_number", "title", "description", "status", "priority", "due_date",
+        "estimated_hours", "actual_hours", "created_at", "updated_at", "assigned_at",
+        "completed_at", "category_id", "category_name", "category_color", "employee_id",
+        "employee_name", "employee_email", "employee_department", "comment_count", "watcher_count"
+    ]
+}
+
+TICKET_EXPORT_COLUMNS = [
+    "id", "ticket_number", "title", "description", "status", "priority",
+    "category_name", "employee_name", "employee_email", "due_date",
+    "estimated_hours", "actual_hours", "created_at", "updated_at",
+    "assigned_at", "completed_at"
+]
+
+def _filter_tickets(query, status=None, priority=None, assigned_to=None, category_id=None, search=None):
+    """Filters shared by the ticket list and export endpoints"""
+    if status:
+        query = query.eq("status", status)
+    if priority:
+        query = query.eq("priority", priority)
+    if assigned_to:
+        query = query.eq("employee_id", assigned_to)
+    if category_id:
+        query = query.eq("category_id", category_id)
+    if search and TICKET_NUMBER_RE.match(search.strip()):
+        query = query.eq("ticket_number", search.strip().upper())
+    elif search:
+        # Served by the trigram indexes on tickets
+        query = query.or_(f"title.ilike.%{search}%,description.ilike.%{search}%,ticket_number.ilike.%{search}%")
+    return query
+
 @router.get("/")
 async def list_tickets(
     status: Optional[str] = None,
@@ -161,80 +233,207 @@ async def list_tickets(
     search: Optional[str] = None,
     limit: int = Query(100, le=500),
     offset: int = 0,
+    cursor: Optional[str] = Query(None, description="next_cursor from a previous page (takes precedence over offset)"),
+    count: Optional[str] = Query(None, pattern=COUNT_PATTERN, description="Include a total: exact, planned or estimated"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     current_user: dict = Depends(get_current_user)
 ):
     """List tickets with optional filtering"""
     try:
-        query = supabase.table("ticket_summary")\
-            .select("*")\
+        columns = select_fields(fields, TICKET_SUMMARY_FIELDS, ("id", "created_at")) if fields else "*"
+        query = db.table("ticket_summary")\
+            .select(columns, count=count)\
             .eq("user_id", current_user.id)
+        query = _filter_tickets(query, status, priority, assigned_to, category_id, search)
+        
+        query = apply_keyset(query, "created_at", cursor)
+        if not cursor:
+            query = query.offset(offset)
+        
+        response = await db.execute(query.limit(limit + 1))
+        tickets, has_more, next_cursor = paginate(response.data, limit, "created_at")
+        
+        return {
+            "tickets": tickets,
+            "count": len(tickets),
+            "total": response.count,
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export")
+async def export_tickets(
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    category_id: Optional[str] = None,
+    search: Optional[str] = None,
+    format: str = Query("csv", pattern=EXPORT_FORMAT_PATTERN, description="csv or ndjson"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream every matching ticket as CSV or NDJSON, newest first"""
+    try:
+        def make_query():
+            query = db.table("ticket_summary")\
+                .select("*")\
+                .eq("user_id", current_user.id)
+            return _filter_tickets(query, status, priority, assigned_to, category_id, search)
+        
+        return await export_response(
+            make_query,
+            "created_at",
+            TICKET_EXPORT_COLUMNS,
+            format,
+            f"tickets-{date.today().isoformat()}"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/changes")
+async def get_ticket_changes(
+    since: Optional[str] = Query(None, description="Watermark from the previous call; omit for a full snapshot"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Tickets created or updated after the watermark (as ticket_summary rows),
+    tombstones for deleted tickets, and the next watermark.
+    """
+    try:
+        changes = await changes_since("ticket_summary", "tickets", current_user.id, since)
+        return {
+            "tickets": changes["changed"],
+            "deleted": changes["deleted"],
+            "watermark": changes["watermark"],
+            "has_more": changes["has_more"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/search")
+async def search_tickets(
+    q: str = Query(..., min_length=1),
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    category_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Ranked full-text ticket search with prefix matching and highlighted snippets.
+    Snippets are HTML-escaped text whose only markup is <mark> around matches.
+    Exact ticket numbers (e.g. TICK-0042) resolve straight to that ticket.
+    """
+    try:
+        term = q.strip()
         
-        if status:
-            query = query.eq("status", status)
-        if priority:
-            query = query.eq("priority", priority)
-        if assigned_to:
-            query = query.eq("employee_id", assigned_to)
-        if category_id:
-            query = query.eq("category_id", category_id)
-        if search:
-            query = query.or_(f"title.ilike.%{search}%,description.ilike.%{search}%,ticket_number.ilike.%{search}%")
-        
-        response = query.order("created_at", desc=True)\
-            .limit(limit)\
-            .offset(offset)\
-            .execute()
-        
-        return {"tickets": response.data, "count": len(response.data)}
+        if TICKET_NUMBER_RE.match(term):
+            response = await db.execute(db.table("ticket_summary")\
+                .select(SEARCH_RESULT_COLUMNS)\
+                .eq("user_id", current_user.id)\
+                .eq("ticket_number", term.upper()))
+            results = [{**row, "rank": 1.0, "snippet": None} for row in response.data]
+            return {"query": q, "results": results, "count": len(results)}
+        
+        try:
+            response = await db.rpc("search_tickets", {
+                "p_user_id": current_user.id,
+                "p_query": term,
+                "p_status": status,
+                "p_priority": priority,
+                "p_employee_id": assigned_to,
+                "p_category_id": category_id,
+                "p_limit": limit,
+                "p_offset": offset
+            })
+            results = response.data
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+            # Search function not deployed yet - unranked substring match
+            query = db.table("ticket_summary")\
+                .select(SEARCH_RESULT_COLUMNS)\
+                .eq("user_id", current_user.id)\
+                .or_(f"title.ilike.%{term}%,description.ilike.%{term}%,ticket_number.ilike.%{term}%")
+            if status:
+                query = query.eq("status", status)
+            if priority:
+                query = query.eq("priority", priority)
+            if assigned_to:
+                query = query.eq("employee_id", assigned_to)
+            if category_id:
+                query = query.eq("category_id", category_id)
+            response = await db.execute(query.order("created_at", desc=True).range(offset, offset + limit - 1))
+            results = [{**row, "rank": None, "snippet": None} for row in response.data]
+        
+        return {"query": q, "results": results, "count": len(results)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{ticket_id}")
 async def get_ticket(
     ticket_id: str,
+    include: Optional[str] = Query(None, description="Comma-separated sections to embed: comments, history, watchers (default: all)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get a single ticket with details"""
     try:
-        # Get ticket from summary view
-        response = supabase.table("ticket_summary")\
-            .select("*")\
-            .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+        if include is None:
+            sections = set(TICKET_DETAIL_SECTIONS)
+        else:
+            sections = {s.strip() for s in include.split(",") if s.strip()}
+            unknown = sections - TICKET_DETAIL_SECTIONS
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Invalid include section(s): {', '.join(sorted(unknown))}")
         
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Ticket not found")
-        
-        ticket = response.data
+        # Get ticket from summary view
+        queries = {
+            "ticket": db.table("ticket_summary")\
+                .select("*")\
+                .eq("id", ticket_id)\
+                .eq("user_id", current_user.id)\
+                .single()
+        }
         
         # Get comments
-        comments_response = supabase.table("ticket_comments")\
-            .select("*, employees(name, email)")\
-            .eq("ticket_id", ticket_id)\
-            .order("created_at", desc=False)\
-            .execute()
-        
-        ticket["comments"] = comments_response.data
+        if "comments" in sections:
+            queries["comments"] = db.table("ticket_comments")\
+                .select("*, employees(name, email)")\
+                .eq("ticket_id", ticket_id)\
+                .order("created_at", desc=False)
         
         # Get history
-        history_response = supabase.table("ticket_history")\
-            .select("*, employees(name)")\
-            .eq("ticket_id", ticket_id)\
-            .order("created_at", desc=True)\
-            .limit(50)\
-            .execute()
-        
-        ticket["history"] = history_response.data
+        if "history" in sections:
+            queries["history"] = db.table("ticket_history")\
+                .select("*, employees(name)")\
+                .eq("ticket_id", ticket_id)\
+                .order("created_at", desc=True)\
+                .limit(50)
         
         # Get watchers
-        watchers_response = supabase.table("ticket_watchers")\
-            .select("*, employees(id, name, email)")\
-            .eq("ticket_id", ticket_id)\
-            .execute()
+        if "watchers" in sections:
+            queries["watchers"] = db.table("ticket_watchers")\
+                .select("*, employees(id, name, email)")\
+                .eq("ticket_id", ticket_id)
+        
+        # Sections only depend on ticket_id, so fetch everything in one round of latency
+        responses = dict(zip(queries, await db.gather(*queries.values())))
+        
+        if not responses["ticket"].data:
+            raise HTTPException(status_code=404, detail="Ticket not found")
         
-        ticket["watchers"] = watchers_response.data
+        ticket = responses.pop("ticket").data
+        for section, section_response in responses.items():
+            ticket[section] = section_response.data
         
         return ticket
     except HTTPException:
@@ -264,16 +463,31 @@ async def create_ticket(
             "tags": ticket.tags
         }
         
-        response = supabase.table("tickets").insert(ticket_data).execute()
-        created_ticket = response.data[0]
+        try:
+            # Ticket and its history entry in one round trip and transaction
+            response = await db.rpc("create_ticket_with_history", {
+                "p_user_id": current_user.id,
+                "p_ticket": ticket_data
+            })
+            created_ticket = response.data[0]
+        except Exception as e:
+            # Only a missing function is safe to retry: any other failure may
+            # have committed, and a second write would duplicate the ticket
+            if not is_missing_function(e):
+                raise
+            # Function not deployed yet - insert, then log creation separately
+            response = await db.execute(db.table("tickets").insert(ticket_data))
+            created_ticket = response.data[0]
+            
+            await db.execute(db.table("ticket_history").insert({
+                "ticket_id": created_ticket["id"],
+                "user_id": current_user.id,
+                "action": "created",
+                "description": f"Ticket {created_ticket['ticket_number']} created"
+            }))
         
-        # Log creation in history
-        supabase.table("ticket_history").insert({
-            "ticket_id": created_ticket["id"],
-            "user_id": current_user.id,
-            "action": "created",
-            "description": f"Ticket {created_ticket['ticket_number']} created"
-        }).execute()
+        _apply_ticket_stats_delta(current_user.id, created_ticket, 1)
+        event_hub.publish(current_user.id, "ticket.created", created_ticket)
         
         return created_ticket
     except Exception as e:
@@ -298,15 +512,17 @@ async def update_ticket(
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        response = supabase.table("tickets")\
+        response = await db.execute(db.table("tickets")\
             .update(update_data)\
             .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Ticket not found")
         
+        _invalidate_ticket_stats(current_user.id)
+        event_hub.publish(current_user.id, "ticket.updated", response.data[0])
+        
         return response.data[0]
     except HTTPException:
         raise
@@ -320,15 +536,17 @@ async def delete_ticket(
 ):
     """Delete a ticket"""
     try:
-        response = supabase.table("tickets")\
+        response = await db.execute(db.table("tickets")\
             .delete()\
             .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Ticket not found")
         
+        _apply_ticket_stats_delta(current_user.id, response.data[0], -1)
+        event_hub.publish(current_user.id, "ticket.deleted", {"id": ticket_id})
+        
         return {"message": "Ticket deleted successfully"}
     except HTTPException:
         raise
@@ -339,31 +557,37 @@ async def delete_ticket(
 async def assign_ticket(
     ticket_id: str,
     assignment: TicketAssign,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Assign or reassign a ticket to an employee"""
     try:
-        # Verify employee exists if assigning
-        if assignment.assigned_to:
-            emp_check = supabase.table("employees")\
-                .select("id, name")\
-                .eq("id", assignment.assigned_to)\
-                .eq("user_id", current_user.id)\
-                .single()\
-                .execute()
-            
-            if not emp_check.data:
-                raise HTTPException(status_code=404, detail="Employee not found")
-        
-        response = supabase.table("tickets")\
-            .update({"assigned_to": assignment.assigned_to})\
-            .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+        # Verify employee exists if assigning (from the directory cache, no round trip)
+        if assignment.assigned_to and not await loaders.employees.load(assignment.assigned_to):
+            raise HTTPException(status_code=404, detail="Employee not found")
+        
+        try:
+            # Re-checks employee ownership in the same statement as the update
+            response = await db.rpc("assign_ticket_to_employee", {
+                "p_user_id": current_user.id,
+                "p_ticket_id": ticket_id,
+                "p_employee_id": assignment.assigned_to
+            })
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+            # Function not deployed yet - plain update
+            response = await db.execute(db.table("tickets")\
+                .update({"assigned_to": assignment.assigned_to})\
+                .eq("id", ticket_id)\
+                .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Ticket not found")
         
+        _invalidate_ticket_stats(current_user.id)
+        event_hub.publish(current_user.id, "ticket.updated", response.data[0])
+        
         return response.data[0]
     except HTTPException:
         raise
@@ -377,27 +601,23 @@ async def assign_ticket(
 @router.get("/{ticket_id}/comments")
 async def list_comments(
     ticket_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """List all comments for a ticket"""
     try:
-        # Verify ticket access
-        ticket_check = supabase.table("tickets")\
-            .select("id")\
-            .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
-        
-        if not ticket_check.data:
+        # Verify ticket access while the comments load; they're discarded if it fails
+        ticket, response = await asyncio.gather(
+            loaders.tickets.load(ticket_id),
+            db.execute(db.table("ticket_comments")\
+                .select("*, employees(id, name, email)")\
+                .eq("ticket_id", ticket_id)\
+                .order("created_at"))
+        )
+        
+        if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
         
-        response = supabase.table("ticket_comments")\
-            .select("*, employees(id, name, email)")\
-            .eq("ticket_id", ticket_id)\
-            .order("created_at")\
-            .execute()
-        
         return {"comments": response.data}
     except HTTPException:
         raise
@@ -409,37 +629,47 @@ async def create_comment(
     ticket_id: str,
     comment: CommentCreate,
     employee_id: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Add a comment to a ticket"""
     try:
-        # Verify ticket access
-        ticket_check = supabase.table("tickets")\
-            .select("id, ticket_number")\
-            .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+        try:
+            # Ticket check, comment and history entry in one round trip and transaction
+            response = await db.rpc("add_ticket_comment", {
+                "p_user_id": current_user.id,
+                "p_ticket_id": ticket_id,
+                "p_content": comment.content,
+                "p_is_internal": comment.is_internal,
+                "p_employee_id": employee_id
+            })
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+            # Function not deployed yet - check, insert and log separately
+            if not await loaders.tickets.load(ticket_id):
+                raise HTTPException(status_code=404, detail="Ticket not found")
+            
+            response = await db.execute(db.table("ticket_comments").insert({
+                "ticket_id": ticket_id,
+                "user_id": current_user.id,
+                "employee_id": employee_id,
+                "content": comment.content,
+                "is_internal": comment.is_internal
+            }))
+            
+            await db.execute(db.table("ticket_history").insert({
+                "ticket_id": ticket_id,
+                "user_id": current_user.id,
+                "employee_id": employee_id,
+                "action": "commented",
+                "description": f"Added a {'internal ' if comment.is_internal else ''}comment"
+            }))
         
-        if not ticket_check.data:
+        if not response.data:
             raise HTTPException(status_code=404, detail="Ticket not found")
         
-        response = supabase.table("ticket_comments").insert({
-            "ticket_id": ticket_id,
-            "user_id": current_user.id,
-            "employee_id": employee_id,
-            "content": comment.content,
-            "is_internal": comment.is_internal
-        }).execute()
-        
-        # Log comment in history
-        supabase.table("ticket_history").insert({
-            "ticket_id": ticket_id,
-            "user_id": current_user.id,
-            "employee_id": employee_id,
-            "action": "commented",
-            "description": f"Added a {'internal ' if comment.is_internal else ''}comment"
-        }).execute()
+        event_hub.publish(current_user.id, "ticket.commented", {"id": ticket_id, "comment": response.data[0]})
         
         return response.data[0]
     except HTTPException:
@@ -456,12 +686,11 @@ async def update_comment(
 ):
     """Update a comment"""
     try:
-        response = supabase.table("ticket_comments")\
+        response = await db.execute(db.table("ticket_comments")\
             .update({"content": comment.content})\
             .eq("id", comment_id)\
             .eq("ticket_id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Comment not found")
@@ -480,12 +709,11 @@ async def delete_comment(
 ):
     """Delete a comment"""
     try:
-        response = supabase.table("ticket_comments")\
+        response = await db.execute(db.table("ticket_comments")\
             .delete()\
             .eq("id", comment_id)\
             .eq("ticket_id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Comment not found")
@@ -500,34 +728,91 @@ async def delete_comment(
 # TICKET STATISTICS
 # ============================================
 
+def _build_ticket_stats(rows):
+    """Fold ticket rows into overview counters in a single pass.
+
+    Accepts either pre-grouped rows from the ticket_status_counts view
+    (status, priority, unassigned, ticket_count) or raw ticket rows
+    (status, priority, assigned_to), which count as one ticket each.
+    """
+    stats = {"total": 0}
+    stats.update({s: 0 for s in TICKET_STATUSES})
+    stats["unassigned"] = 0
+    stats.update({p: 0 for p in TICKET_PRIORITIES})
+    
+    for row in rows:
+        n = row.get("ticket_count", 1)
+        stats["total"] += n
+        if row["status"] in TICKET_STATUSES:
+            stats[row["status"]] += n
+        if row["priority"] in TICKET_PRIORITIES:
+            stats[row["priority"]] += n
+        if row["unassigned"] if "unassigned" in row else not row.get("assigned_to"):
+            stats["unassigned"] += n
+    
+    return stats
+
+def _apply_ticket_stats_delta(user_id: str, ticket: dict, sign: int):
+    """
+    Update cached dashboard counters in place for a created (+1) or deleted (-1)
+    ticket. Anything the delta can't express drops the cached section instead.
+    """
+    ticket_stats_changed(user_id)
+    cached = ticket_stats_cache.get(user_id)
+    if not cached:
+        return
+    
+    if "overview" in cached:
+        for key, value in _build_ticket_stats([ticket]).items():
+            cached["overview"][key] += sign * value
+    
+    if "by_category" in cached:
+        categories = cached["by_category"]
+        entry = categories.get(ticket.get("category_id") or "uncategorized")
+        if entry is None:
+            # New category bucket: name and color aren't on the ticket row
+            del cached["by_category"]
+        else:
+            entry["count"] += sign
+            if entry["count"] <= 0:
+                del categories[entry["category_id"]]
+
+def _invalidate_ticket_stats(user_id: str):
+    """Drop cached dashboard counters after a change the delta path can't follow"""
+    ticket_stats_changed(user_id)
+    ticket_stats_cache.invalidate(user_id)
+
+def _cache_ticket_stats(user_id: str, section: str, value, version: int):
+    """Cache a stats section unless a ticket write landed since `version` was read"""
+    if ticket_stats_versions.get(user_id, 0) == version:
+        ticket_stats_cache.setdefault(user_id, {})[section] = value
+
 @router.get("/stats/overview")
 async def get_ticket_stats(current_user: dict = Depends(get_current_user)):
     """Get overall ticket statistics"""
     try:
-        # Get all tickets
-        response = supabase.table("tickets")\
-            .select("status, priority, assigned_to")\
-            .eq("user_id", current_user.id)\
-            .execute()
-        
-        tickets = response.data
-        
-        stats = {
-            "total": len(tickets),
-            "open": len([t for t in tickets if t["status"] == "open"]),
-            "in_progress": len([t for t in tickets if t["status"] == "in_progress"]),
-            "in_review": len([t for t in tickets if t["status"] == "in_review"]),
-            "resolved": len([t for t in tickets if t["status"] == "resolved"]),
-            "closed": len([t for t in tickets if t["status"] == "closed"]),
-            "blocked": len([t for t in tickets if t["status"] == "blocked"]),
-            "unassigned": len([t for t in tickets if not t["assigned_to"]]),
-            "urgent": len([t for t in tickets if t["priority"] == "urgent"]),
-            "high": len([t for t in tickets if t["priority"] == "high"]),
-            "medium": len([t for t in tickets if t["priority"] == "medium"]),
-            "low": len([t for t in tickets if t["priority"] == "low"])
-        }
-        
-        return stats
+        cached = ticket_stats_cache.get(current_user.id, {}).get("overview")
+        if cached is not None:
+            return dict(cached)
+        version = ticket_stats_versions.get(current_user.id, 0)
+        
+        try:
+            # Grouped counts: at most statuses x priorities x 2 rows per user
+            response = await db.execute(db.table("ticket_status_counts")\
+                .select("status, priority, unassigned, ticket_count")\
+                .eq("user_id", current_user.id))
+        except Exception as e:
+            if not is_missing_relation(e):
+                raise
+            # View not deployed yet - count raw rows instead
+            response = await db.execute(db.table("tickets")\
+                .select("status, priority, assigned_to")\
+                .eq("user_id", current_user.id))
+        
+        stats = _build_ticket_stats(response.data)
+        _cache_ticket_stats(current_user.id, "overview", stats, version)
+        
+        return dict(stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -535,10 +820,14 @@ async def get_ticket_stats(current_user: dict = Depends(get_current_user)):
 async def get_tickets_by_category(current_user: dict = Depends(get_current_user)):
     """Get ticket count by category"""
     try:
-        response = supabase.table("ticket_summary")\
+        cached = ticket_stats_cache.get(current_user.id, {}).get("by_category")
+        if cached is not None:
+            return {"categories": [dict(c) for c in cached.values()]}
+        version = ticket_stats_versions.get(current_user.id, 0)
+        
+        response = await db.execute(db.table("ticket_summary")\
             .select("category_id, category_name, category_color")\
-            .eq("user_id", current_user.id)\
-            .execute()
+            .eq("user_id", current_user.id))
         
         # Count tickets by category
         category_counts = {}
@@ -556,7 +845,9 @@ async def get_tickets_by_category(current_user: dict = Depends(get_current_user)
                 }
             category_counts[cat_id]["count"] += 1
         
-        return {"categories": list(category_counts.values())}
+        _cache_ticket_stats(current_user.id, "by_category", category_counts, version)
+        
+        return {"categories": [dict(c) for c in category_counts.values()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -572,13 +863,18 @@ async def recommend_employees(
 ):
     """Get recommended employees for a ticket based on specializations and workload"""
     try:
-        # Get ticket with category
-        ticket_response = supabase.table("tickets")\
-            .select("*, ticket_categories(name)")\
-            .eq("id", ticket_id)\
-            .eq("user_id", current_user.id)\
-            .single()\
-            .execute()
+        # Ticket (with category) and this tenant's workload are independent lookups
+        ticket_response, workload_response = await db.gather(
+            db.table("tickets")\
+                .select("id, title, ticket_categories(name)")\
+                .eq("id", ticket_id)\
+                .eq("user_id", current_user.id)\
+                .single(),
+            db.table("employee_workload")\
+                .select("*")\
+                .eq("user_id", current_user.id)\
+                .eq("is_active", True)
+        )
         
         if not ticket_response.data:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -586,80 +882,93 @@ async def recommend_employees(
         ticket = ticket_response.data
         category_name = ticket.get("ticket_categories", {}).get("name") if ticket.get("ticket_categories") else None
         
-        # Get employee workload
-        workload_response = supabase.table("employee_workload")\
-            .select("*")\
-            .execute()
-        
-        employees = workload_response.data
-        
-        # Score employees
-        scored_employees = []
-        for emp in employees:
-            score = 0
-            reasons = []
-            
-            # Check if employee is active
-            if not emp.get("is_active", True):
-                continue
-            
-            # Specialization match (highest weight)
-            if emp.get("specializations") and category_name:
-                if category_name.lower() in [s.lower() for s in emp["specializations"]]:
-                    score += 50
-                    reasons.append(f"Specializes in {category_name}")
-            
-            # Workload consideration (prefer less busy employees)
-            active = emp.get("active_tickets", 0)
-            if active == 0:
-                score += 30
-                reasons.append("Available (no active tickets)")
-            elif active <= 2:
-                score += 20
-                reasons.append("Light workload")
-            elif active <= 5:
-                score += 10
-                reasons.append("Moderate workload")
-            else:
-                score -= 10
-                reasons.append("Heavy workload")
-            
-            # Experience (based on completed tickets)
-            completed = emp.get("completed_tickets", 0)
-            if completed > 20:
-                score += 15
-                reasons.append("Highly experienced")
-            elif completed > 10:
-                score += 10
-                reasons.append("Experienced")
-            elif completed > 5:
-                score += 5
-                reasons.append("Some experience")
-            
-            # Add some randomness to prevent always recommending same person
-            import random
-            score += random.randint(0, 5)
-            
-            scored_employees.append({
-                **emp,
-                "recommendation_score": score,
-                "recommendation_reasons": reasons
-            })
-        
-        # Sort by score and return top N
-        scored_employees.sort(key=lambda x: x["recommendation_score"], reverse=True)
+        pool = CandidatePool(workload_response.data)
         
         return {
             "ticket_id": ticket_id,
             "ticket_title": ticket["title"],
             "category": category_name,
-            "recommendations": scored_employees[:limit]
+            "recommendations": pool.recommend(category_name, limit)
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/recommend-employees/batch")
+async def recommend_employees_bulk(
+    request: BulkRecommendationRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Recommend employees for many tickets at once (triage). Workload is loaded
+    once and every ticket is scored against the same candidate pool.
+    """
+    try:
+        if request.ticket_ids is not None and len(request.ticket_ids) > MAX_BULK_RECOMMENDATIONS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_RECOMMENDATIONS} tickets per request")
+        
+        tickets_query = db.table("tickets")\
+            .select("id, ticket_number, title, priority, created_at, ticket_categories(name)")\
+            .eq("user_id", current_user.id)
+        
+        if request.ticket_ids is not None:
+            tickets_query = tickets_query.in_("id", request.ticket_ids)
+        else:
+            tickets_query = tickets_query\
+                .is_("assigned_to", "null")\
+                .not_.in_("status", ["resolved", "closed"])\
+                .order("created_at")\
+                .limit(MAX_BULK_RECOMMENDATIONS)
+        
+        tickets_response, workload_response = await db.gather(
+            tickets_query,
+            db.table("employee_workload")\
+                .select("*")\
+                .eq("user_id", current_user.id)\
+                .eq("is_active", True)
+        )
+        
+        tickets = tickets_response.data
+        pool = CandidatePool(workload_response.data)
+        
+        results = []
+        for ticket in tickets:
+            category_name = ticket["ticket_categories"]["name"] if ticket.get("ticket_categories") else None
+            results.append({
+                "ticket_id": ticket["id"],
+                "ticket_number": ticket["ticket_number"],
+                "ticket_title": ticket["title"],
+                "category": category_name,
+                "recommendations": pool.recommend(category_name, request.limit)
+            })
+        
+        response = {"tickets": results, "count": len(results)}
+        
+        if request.plan_assignments:
+            queue = sorted(
+                zip(tickets, results),
+                key=lambda pair: (PRIORITY_RANK.get(pair[0].get("priority"), len(PRIORITY_RANK)), pair[0]["created_at"])
+            )
+            plan = pool.plan_assignments([(result["ticket_id"], result["category"]) for _, result in queue])
+            numbers = {result["ticket_id"]: result["ticket_number"] for result in results}
+            response["assignments"] = [
+                {
+                    "ticket_id": ticket_id,
+                    "ticket_number": numbers[ticket_id],
+                    "employee_id": pool.employees[position]["employee_id"],
+                    "employee_name": pool.employees[position]["employee_name"],
+                    "score": score
+                }
+                for ticket_id, position, score in plan
+            ]
+        
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
 # ============================================
 # EMPLOYEE-SIDE TICKET UPDATES
@@ -691,12 +1000,11 @@ async def employee_update_ticket(
     """
     try:
         # Check if ticket exists and is assigned to this user's employee
-        ticket_response = supabase.table('tickets')\
+        ticket_response = await db.execute(db.table('tickets')\
             .select('*, assigned_employee:employees!assigned_to(id, user_id, name)')\
             .eq('id', ticket_id)\
             .eq('user_id', user.id)\
-            .single()\
-            .execute()
+            .single())
         
         if not ticket_response.data:
             raise HTTPException(status_code=404, detail="Ticket not found or not assigned to you")
@@ -714,10 +1022,12 @@ async def employee_update_ticket(
             raise HTTPException(status_code=400, detail="No fields to update")
         
         # Update ticket
-        response = supabase.table('tickets')\
+        response = await db.execute(db.table('tickets')\
             .update(update_dict)\
-            .eq('id', ticket_id)\
-            .execute()
+            .eq('id', ticket_id))
+        
+        _invalidate_ticket_stats(user.id)
+        event_hub.publish(user.id, "ticket.updated", response.data[0])
         
         return {
             "message": "Ticket updated successfully",
@@ -740,7 +1050,7 @@ async def create_partial_ticket(
     Admin will later assign category, priority, employee, etc.
     """
     try:
-        response = supabase.table('tickets')\
+        response = await db.execute(db.table('tickets')\
             .insert({
                 'title': ticket.title,
                 'description': ticket.description,
@@ -751,11 +1061,13 @@ async def create_partial_ticket(
                 'priority': 'medium',  # Default priority
                 'user_id': user.id,
                 # ticket_number will be auto-generated by trigger
-            })\
-            .execute()
+            }))
         
         created_ticket = response.data[0]
         
+        _apply_ticket_stats_delta(user.id, created_ticket, 1)
+        event_hub.publish(user.id, "ticket.created", created_ticket)
+        
         # Create notification for admin
         
         return {
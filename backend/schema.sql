@@ -3,6 +3,9 @@
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
+-- Enable trigram extension (indexed ILIKE search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- ============================================
 -- CORE TABLES
 -- ============================================
@@ -15,6 +18,8 @@ DROP TABLE IF EXISTS employee_time_logs CASCADE;
 DROP TABLE IF EXISTS ticket_attachments CASCADE;
 DROP TABLE IF EXISTS ticket_watchers CASCADE;
 DROP TABLE IF EXISTS employee_metrics CASCADE;
+DROP TABLE IF EXISTS deleted_records CASCADE;
+DROP TABLE IF EXISTS employee_time_daily CASCADE;
 
 
 -- Employees table with specializations
@@ -69,6 +74,15 @@ CREATE TABLE tickets (
   completed_at TIMESTAMP WITH TIME ZONE
 );
 
+-- Full-text search document: title weighted above description. Indexed as
+-- an expression rather than stored, so ticket rows and payloads stay small;
+-- search_tickets matches on this same expression so it can use the index.
+CREATE OR REPLACE FUNCTION ticket_search_vector(p_title TEXT, p_description TEXT)
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('english'::regconfig, COALESCE(p_title, '')), 'A') ||
+           setweight(to_tsvector('english'::regconfig, COALESCE(p_description, '')), 'B');
+$$ LANGUAGE sql IMMUTABLE;
+
 -- Ticket comments
 CREATE TABLE ticket_comments (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -148,6 +162,29 @@ CREATE TABLE employee_metrics (
   UNIQUE(employee_id, period_start, period_end)
 );
 
+-- Tombstones for deleted rows, so delta sync clients can drop them.
+-- No FK on user_id: deleting an account cascades into tickets/employees,
+-- whose triggers must not insert rows referencing the departing user.
+-- Old tombstones are removed by prune_deleted_records().
+CREATE TABLE deleted_records (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  user_id UUID NOT NULL,
+  table_name VARCHAR(50) NOT NULL, -- 'tickets' or 'employees'
+  record_id UUID NOT NULL,
+  deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Daily hours per employee, kept in step with employee_time_logs by triggers
+CREATE TABLE employee_time_daily (
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  employee_id UUID NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+  work_date DATE NOT NULL,
+  is_billable BOOLEAN NOT NULL,
+  total_hours DECIMAL(10, 2) NOT NULL DEFAULT 0,
+  log_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, employee_id, work_date, is_billable)
+);
+
 -- ============================================
 -- INDEXES FOR PERFORMANCE
 -- ============================================
@@ -158,6 +195,8 @@ CREATE INDEX idx_employees_department ON employees(department);
 CREATE INDEX idx_employees_email ON employees(email);
 CREATE INDEX idx_employees_active ON employees(is_active);
 CREATE INDEX idx_employees_specializations ON employees USING GIN(specializations);
+CREATE INDEX idx_employees_user_created ON employees(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_employees_user_updated ON employees(user_id, updated_at, id);
 
 -- Ticket category indexes
 CREATE INDEX idx_ticket_categories_user_id ON ticket_categories(user_id);
@@ -172,6 +211,12 @@ CREATE INDEX idx_tickets_created_at ON tickets(created_at DESC);
 CREATE INDEX idx_tickets_due_date ON tickets(due_date);
 CREATE INDEX idx_tickets_tags ON tickets USING GIN(tags);
 CREATE INDEX idx_tickets_number ON tickets(ticket_number);
+CREATE INDEX idx_tickets_user_created ON tickets(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_tickets_user_updated ON tickets(user_id, updated_at, id);
+CREATE INDEX idx_tickets_search_vector ON tickets USING GIN(ticket_search_vector(title, description));
+CREATE INDEX idx_tickets_title_trgm ON tickets USING GIN(title gin_trgm_ops);
+CREATE INDEX idx_tickets_description_trgm ON tickets USING GIN(description gin_trgm_ops);
+CREATE INDEX idx_tickets_number_trgm ON tickets USING GIN(ticket_number gin_trgm_ops);
 
 -- Comment indexes
 CREATE INDEX idx_ticket_comments_ticket_id ON ticket_comments(ticket_id);
@@ -186,6 +231,7 @@ CREATE INDEX idx_employee_time_logs_employee_id ON employee_time_logs(employee_i
 CREATE INDEX idx_employee_time_logs_ticket_id ON employee_time_logs(ticket_id);
 CREATE INDEX idx_employee_time_logs_work_date ON employee_time_logs(work_date DESC);
 CREATE INDEX idx_employee_time_logs_user_id ON employee_time_logs(user_id);
+CREATE INDEX idx_employee_time_logs_user_work_date ON employee_time_logs(user_id, work_date DESC, id DESC);
 
 -- Attachment indexes
 CREATE INDEX idx_ticket_attachments_ticket_id ON ticket_attachments(ticket_id);
@@ -195,6 +241,13 @@ CREATE INDEX idx_ticket_watchers_ticket_id ON ticket_watchers(ticket_id);
 CREATE INDEX idx_ticket_watchers_employee_id ON ticket_watchers(employee_id);
 CREATE INDEX idx_ticket_watchers_user_id ON ticket_watchers(user_id);
 
+-- Tombstone indexes
+CREATE INDEX idx_deleted_records_lookup ON deleted_records(user_id, table_name, deleted_at, id);
+CREATE INDEX idx_deleted_records_deleted_at ON deleted_records(deleted_at);
+
+-- Time rollup indexes (the primary key covers per-employee lookups)
+CREATE INDEX idx_employee_time_daily_user_date ON employee_time_daily(user_id, work_date);
+
 -- Metrics indexes
 CREATE INDEX idx_employee_metrics_employee_id ON employee_metrics(employee_id);
 CREATE INDEX idx_employee_metrics_period ON employee_metrics(period_start, period_end);
@@ -212,6 +265,8 @@ ALTER TABLE employee_time_logs ENABLE ROW LEVEL SECURITY;
 ALTER TABLE ticket_attachments ENABLE ROW LEVEL SECURITY;
 ALTER TABLE ticket_watchers ENABLE ROW LEVEL SECURITY;
 ALTER TABLE employee_metrics ENABLE ROW LEVEL SECURITY;
+ALTER TABLE deleted_records ENABLE ROW LEVEL SECURITY;
+ALTER TABLE employee_time_daily ENABLE ROW LEVEL SECURITY;
 
 -- Employee policies
 CREATE POLICY "Users can view their own employees" 
@@ -350,6 +405,16 @@ CREATE POLICY "Users can delete metrics for their employees"
   ON employee_metrics   FOR DELETE 
   USING (employee_id IN (SELECT id FROM employees WHERE user_id = auth.uid()));
 
+-- Tombstone policies
+CREATE POLICY "Users can view their deleted records" 
+  ON deleted_records FOR SELECT 
+  USING (auth.uid() = user_id);
+
+-- Time rollup policies (rows are written by triggers only)
+CREATE POLICY "Users can view their daily time totals" 
+  ON employee_time_daily FOR SELECT 
+  USING (auth.uid() = user_id);
+
 -- ============================================
 -- FUNCTIONS AND TRIGGERS
 -- ============================================
@@ -506,6 +571,263 @@ CREATE TRIGGER update_ticket_hours_on_delete
     WHEN (OLD.ticket_id IS NOT NULL)
     EXECUTE FUNCTION update_ticket_actual_hours();
 
+-- Function to keep employee_time_daily in step with time logs. Removals only
+-- update existing rows, so cascaded deletes never recreate a rollup row.
+CREATE OR REPLACE FUNCTION update_time_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE employee_time_daily
+        SET total_hours = total_hours - OLD.hours_worked,
+            log_count = log_count - 1
+        WHERE user_id = OLD.user_id
+          AND employee_id = OLD.employee_id
+          AND work_date = OLD.work_date
+          AND is_billable = COALESCE(OLD.is_billable, FALSE);
+        
+        DELETE FROM employee_time_daily
+        WHERE user_id = OLD.user_id
+          AND employee_id = OLD.employee_id
+          AND work_date = OLD.work_date
+          AND is_billable = COALESCE(OLD.is_billable, FALSE)
+          AND log_count <= 0;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO employee_time_daily (user_id, employee_id, work_date, is_billable, total_hours, log_count)
+        VALUES (NEW.user_id, NEW.employee_id, NEW.work_date, COALESCE(NEW.is_billable, FALSE), NEW.hours_worked, 1)
+        ON CONFLICT (user_id, employee_id, work_date, is_billable) DO UPDATE
+        SET total_hours = employee_time_daily.total_hours + EXCLUDED.total_hours,
+            log_count = employee_time_daily.log_count + 1;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER update_time_rollup_on_change
+    AFTER INSERT OR UPDATE OR DELETE ON employee_time_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_time_rollup();
+
+-- Backfill the rollup from any existing time logs
+INSERT INTO employee_time_daily (user_id, employee_id, work_date, is_billable, total_hours, log_count)
+SELECT user_id, employee_id, work_date, COALESCE(is_billable, FALSE), SUM(hours_worked), COUNT(*)
+FROM employee_time_logs
+GROUP BY user_id, employee_id, work_date, COALESCE(is_billable, FALSE)
+ON CONFLICT DO NOTHING;
+
+-- Ranked full-text ticket search with prefix matching and highlighted snippets
+CREATE OR REPLACE FUNCTION search_tickets(
+    p_user_id UUID,
+    p_query TEXT,
+    p_status TEXT DEFAULT NULL,
+    p_priority TEXT DEFAULT NULL,
+    p_employee_id UUID DEFAULT NULL,
+    p_category_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID,
+    ticket_number VARCHAR,
+    title VARCHAR,
+    status VARCHAR,
+    priority VARCHAR,
+    category_name VARCHAR,
+    employee_id UUID,
+    employee_name VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    snippet TEXT
+) AS $$
+    WITH q AS (
+        -- Every term is a prefix match: 'auth fail' -> 'auth:* & fail:*'
+        SELECT to_tsquery('english', string_agg(term || ':*', ' & ')) AS query
+        FROM unnest(regexp_split_to_array(
+            lower(trim(regexp_replace(p_query, '[^[:alnum:][:space:]]', ' ', 'g'))), '[[:space:]]+'
+        )) AS term
+        WHERE term <> ''
+    ),
+    ranked AS (
+        SELECT t.*, ts_rank(ticket_search_vector(t.title, t.description), q.query) AS rank, q.query
+        FROM tickets t, q
+        WHERE t.user_id = p_user_id
+          AND ticket_search_vector(t.title, t.description) @@ q.query
+          AND (p_status IS NULL OR t.status = p_status)
+          AND (p_priority IS NULL OR t.priority = p_priority)
+          AND (p_employee_id IS NULL OR t.assigned_to = p_employee_id)
+          AND (p_category_id IS NULL OR t.category_id = p_category_id)
+        ORDER BY rank DESC, t.created_at DESC
+        LIMIT p_limit OFFSET p_offset
+    )
+    -- Headlines only for the returned page
+    SELECT
+        r.id,
+        r.ticket_number,
+        r.title,
+        r.status,
+        r.priority,
+        tc.name,
+        e.id,
+        e.name,
+        r.created_at,
+        r.rank,
+        -- Escape the text first so <mark> is the snippet's only markup
+        ts_headline('english',
+                    replace(replace(replace(replace(replace(
+                        COALESCE(NULLIF(r.description, ''), r.title),
+                        '&', '&amp;'), '<', '&lt;'), '>', '&gt;'), '"', '&quot;'), '''', '&#39;'),
+                    r.query,
+                    'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5')
+    FROM ranked r
+    LEFT JOIN ticket_categories tc ON r.category_id = tc.id
+    LEFT JOIN employees e ON r.assigned_to = e.id
+    ORDER BY r.rank DESC, r.created_at DESC;
+$$ LANGUAGE sql STABLE;
+
+-- Function to record a tombstone for delta sync
+CREATE OR REPLACE FUNCTION record_deletion()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Skip rows removed because their owner's account is being deleted
+    IF EXISTS (SELECT 1 FROM auth.users WHERE id = OLD.user_id) THEN
+        INSERT INTO deleted_records (user_id, table_name, record_id)
+        VALUES (OLD.user_id, TG_TABLE_NAME, OLD.id);
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER record_ticket_deletion
+    AFTER DELETE ON tickets
+    FOR EACH ROW
+    EXECUTE FUNCTION record_deletion();
+
+CREATE TRIGGER record_employee_deletion
+    AFTER DELETE ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION record_deletion();
+
+-- Drop tombstones older than the retention window (keep in step with
+-- TOMBSTONE_RETENTION_DAYS in the API, which asks older watermarks to
+-- resync). Schedule it daily, e.g. with pg_cron:
+--   SELECT cron.schedule('prune-deleted-records', '0 3 * * *', 'SELECT prune_deleted_records()');
+CREATE OR REPLACE FUNCTION prune_deleted_records(p_retention INTERVAL DEFAULT INTERVAL '90 days')
+RETURNS INTEGER AS $$
+DECLARE
+    v_removed INTEGER;
+BEGIN
+    DELETE FROM deleted_records WHERE deleted_at < NOW() - p_retention;
+    GET DIAGNOSTICS v_removed = ROW_COUNT;
+    RETURN v_removed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function to bump a ticket's updated_at when its comments or watchers change,
+-- so delta sync picks up the new comment/watcher counts
+CREATE OR REPLACE FUNCTION touch_parent_ticket()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE tickets SET updated_at = NOW() WHERE id = OLD.ticket_id;
+    ELSE
+        UPDATE tickets SET updated_at = NOW() WHERE id = NEW.ticket_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER touch_ticket_on_comment
+    AFTER INSERT OR DELETE ON ticket_comments
+    FOR EACH ROW
+    EXECUTE FUNCTION touch_parent_ticket();
+
+CREATE TRIGGER touch_ticket_on_watcher
+    AFTER INSERT OR DELETE ON ticket_watchers
+    FOR EACH ROW
+    EXECUTE FUNCTION touch_parent_ticket();
+
+-- ============================================
+-- TRANSACTIONAL TICKET WRITES
+-- ============================================
+-- Each function validates, writes and audits in one call (and one
+-- transaction), so a write never lands without its history row.
+
+-- Create a ticket and its 'created' history entry. p_ticket holds the
+-- ticket columns as sent by the API; missing status/priority use defaults.
+CREATE OR REPLACE FUNCTION create_ticket_with_history(
+    p_user_id UUID,
+    p_ticket JSONB
+)
+RETURNS SETOF tickets AS $$
+DECLARE
+    v_ticket tickets;
+BEGIN
+    INSERT INTO tickets (user_id, title, description, category_id, status, priority, assigned_to,
+                         reported_by, reporter_email, due_date, estimated_hours, tags)
+    SELECT p_user_id, r.title, r.description, r.category_id, COALESCE(r.status, 'open'),
+           COALESCE(r.priority, 'medium'), r.assigned_to, r.reported_by, r.reporter_email,
+           r.due_date, r.estimated_hours, r.tags
+    FROM jsonb_populate_record(NULL::tickets, p_ticket) r
+    RETURNING * INTO v_ticket;
+    
+    INSERT INTO ticket_history (ticket_id, user_id, action, description)
+    VALUES (v_ticket.id, p_user_id, 'created', 'Ticket ' || v_ticket.ticket_number || ' created');
+    
+    RETURN NEXT v_ticket;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Assign (or with a NULL employee, unassign) one of the user's tickets.
+-- Returns no row if the ticket or employee doesn't belong to the user;
+-- the log_ticket_changes trigger records the history entry.
+CREATE OR REPLACE FUNCTION assign_ticket_to_employee(
+    p_user_id UUID,
+    p_ticket_id UUID,
+    p_employee_id UUID DEFAULT NULL
+)
+RETURNS SETOF tickets AS $$
+    UPDATE tickets t
+    SET assigned_to = p_employee_id
+    WHERE t.id = p_ticket_id
+      AND t.user_id = p_user_id
+      AND (p_employee_id IS NULL OR EXISTS (
+          SELECT 1 FROM employees e WHERE e.id = p_employee_id AND e.user_id = p_user_id
+      ))
+    RETURNING t.*;
+$$ LANGUAGE sql;
+
+-- Add a comment to one of the user's tickets with its 'commented' history
+-- entry. Returns no row if the ticket doesn't belong to the user.
+CREATE OR REPLACE FUNCTION add_ticket_comment(
+    p_user_id UUID,
+    p_ticket_id UUID,
+    p_content TEXT,
+    p_is_internal BOOLEAN DEFAULT FALSE,
+    p_employee_id UUID DEFAULT NULL
+)
+RETURNS SETOF ticket_comments AS $$
+DECLARE
+    v_comment ticket_comments;
+BEGIN
+    PERFORM 1 FROM tickets WHERE id = p_ticket_id AND user_id = p_user_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+    
+    INSERT INTO ticket_comments (ticket_id, user_id, employee_id, content, is_internal)
+    VALUES (p_ticket_id, p_user_id, p_employee_id, p_content, p_is_internal)
+    RETURNING * INTO v_comment;
+    
+    INSERT INTO ticket_history (ticket_id, user_id, employee_id, action, description)
+    VALUES (p_ticket_id, p_user_id, p_employee_id, 'commented',
+            'Added a ' || CASE WHEN p_is_internal THEN 'internal ' ELSE '' END || 'comment');
+    
+    RETURN NEXT v_comment;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ============================================
 -- VIEWS FOR COMMON QUERIES
 -- ============================================
@@ -527,6 +849,7 @@ SELECT
     t.updated_at,
     t.assigned_at,
     t.completed_at,
+    t.category_id,
     tc.name AS category_name,
     tc.color AS category_color,
     e.id AS employee_id,
@@ -543,10 +866,12 @@ LEFT JOIN employees e ON t.assigned_to = e.id;
 CREATE OR REPLACE VIEW employee_workload AS
 SELECT 
     e.id AS employee_id,
+    e.user_id,
     e.name AS employee_name,
     e.email,
     e.department,
     e.specializations,
+    e.is_active,
     COUNT(CASE WHEN t.status NOT IN ('resolved', 'closed') THEN 1 END) AS active_tickets,
     COUNT(CASE WHEN t.status = 'in_progress' THEN 1 END) AS in_progress_tickets,
     COUNT(CASE WHEN t.status IN ('resolved', 'closed') THEN 1 END) AS completed_tickets,
@@ -554,7 +879,29 @@ SELECT
     COALESCE(SUM(t.actual_hours), 0) AS total_hours_logged
 FROM employees e
 LEFT JOIN tickets t ON e.id = t.assigned_to
-GROUP BY e.id, e.name, e.email, e.department, e.specializations;
+GROUP BY e.id, e.user_id, e.name, e.email, e.department, e.specializations, e.is_active;
+
+-- View for ticket overview stats (status x priority x assignment counts per user)
+CREATE OR REPLACE VIEW ticket_status_counts AS
+SELECT
+    t.user_id,
+    t.status,
+    t.priority,
+    (t.assigned_to IS NULL) AS unassigned,
+    COUNT(*) AS ticket_count
+FROM tickets t
+GROUP BY t.user_id, t.status, t.priority, (t.assigned_to IS NULL);
+
+-- View for department stats (assigned ticket counts per department x status)
+CREATE OR REPLACE VIEW department_ticket_counts AS
+SELECT
+    e.user_id,
+    e.department,
+    t.status,
+    COUNT(*) AS ticket_count
+FROM tickets t
+JOIN employees e ON t.assigned_to = e.id
+GROUP BY e.user_id, e.department, t.status;
 
 -- ============================================
 -- INITIAL DATA / SEED DATA
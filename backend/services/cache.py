@@ -0,0 +1,71 @@
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache whose entries expire `ttl` seconds after
+    they were stored. Only touched from the event loop, so no locking.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """Store a value; `ttl` overrides the cache default for this entry"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def setdefault(self, key, default):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self.set(key, default)
+            return default
+        return value
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Per-user dashboard counters ({"overview": ..., "by_category": ...}),
+# kept current in place by the ticket write paths
+ticket_stats_cache = TTLCache(
+    maxsize=int(os.getenv("TICKET_STATS_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("TICKET_STATS_CACHE_TTL", "30"))
+)
+
+# Per-user count of ticket writes: a stats query that raced a write (whose
+# delta or invalidation it may have missed) is served but not cached
+ticket_stats_versions = {}
+
+
+def ticket_stats_changed(user_id: str):
+    """Record a ticket write that cached dashboard counters must not predate"""
+    ticket_stats_versions[user_id] = ticket_stats_versions.get(user_id, 0) + 1
@@ -0,0 +1,156 @@
+import os
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from config.database import db
+from services.pagination import keyset_after, parse_position
+
+# Most changed rows (and, separately, tombstones) returned per call
+CHANGES_PAGE_SIZE = 1000
+# Tombstones older than this are pruned (prune_deleted_records in schema.sql),
+# so older watermarks can no longer be resumed
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "90"))
+# updated_at/deleted_at hold the writing transaction's start time, so a slow
+# transaction can commit rows stamped before a poll that already ran; a
+# caught-up list resumes this far before the poll to pick them up
+CHANGES_OVERLAP_SECONDS = int(os.getenv("CHANGES_OVERLAP_SECONDS", "60"))
+
+
+def _parse(timestamp) -> datetime:
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _check_retention(issued_at):
+    """410 if tombstones written since the watermark was issued may already be pruned"""
+    if issued_at is None:
+        return
+    if _parse(issued_at) < datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        raise HTTPException(status_code=410, detail="Watermark expired; fetch a full snapshot by omitting since")
+
+
+def _caught_up(position, cutoff: datetime):
+    """Resume a fully read list from `cutoff` unless its last row is older"""
+    if position is not None and _parse(position[0]) <= cutoff:
+        return position
+    return cutoff.isoformat(), None
+
+
+def encode_watermark(changed_position, deleted_position, issued_at: str):
+    """
+    Opaque watermark holding the last (timestamp, id) sent from each list and
+    the time tombstones were last read up to the present
+    """
+    raw = json.dumps([changed_position, deleted_position, issued_at], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_position(position):
+    if position is None:
+        return None
+    timestamp, row_id = position
+    if row_id is None:
+        # Timestamp-only position: resume after that instant
+        if not isinstance(timestamp, str):
+            raise ValueError("watermark timestamp must be a string")
+        _parse(timestamp)
+        return timestamp, None
+    return parse_position(timestamp, row_id)
+
+
+def decode_watermark(watermark: str):
+    """
+    Return the (changed, deleted) positions and issue time stored in a
+    watermark. A bare ISO timestamp (the format of earlier watermarks)
+    resumes both lists after that instant.
+    """
+    try:
+        _parse(watermark)
+        return (watermark, None), (watermark, None), watermark
+    except ValueError:
+        pass
+    try:
+        padded = watermark + "=" * (-len(watermark) % 4)
+        changed_position, deleted_position, issued_at = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(issued_at, str):
+            raise ValueError("watermark issue time must be a string")
+        _parse(issued_at)
+        return _decode_position(changed_position), _decode_position(deleted_position), issued_at
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid watermark")
+
+
+def _after(query, column: str, position):
+    """Order by (column, id) and resume strictly after `position`"""
+    if position is not None:
+        timestamp, row_id = position
+        if row_id is None:
+            query = query.gt(column, timestamp)
+        else:
+            query = keyset_after(query, column, timestamp, row_id, desc=False)
+    return query.order(column).order("id")
+
+
+async def changes_since(source: str, record_table: str, user_id: str, since: str = None, limit: int = CHANGES_PAGE_SIZE):
+    """
+    Rows of `source` created or updated after the `since` watermark, plus
+    tombstones for `record_table` rows deleted after it, and the watermark
+    to pass next time. Without `since` this is a full snapshot; a watermark
+    issued longer ago than the tombstone retention window is a 410.
+
+    While a list has more pages it resumes after its own last (timestamp,
+    id), so rows sharing one timestamp (e.g. stamped by a single statement)
+    are never skipped. Once read to the end it resumes CHANGES_OVERLAP_SECONDS
+    before this call, so recent rows may be sent again, as may a row changed
+    again after it was sent; clients should upsert by id.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+    changed_position, deleted_position, issued_at = decode_watermark(since) if since else (None, None, None)
+    _check_retention(issued_at)
+
+    changed_query = _after(db.table(source)\
+        .select("*")\
+        .eq("user_id", user_id), "updated_at", changed_position)\
+        .limit(limit + 1)
+
+    if since:
+        changed_response, deleted_response = await db.gather(
+            changed_query,
+            _after(db.table("deleted_records")\
+                .select("id, record_id, deleted_at")\
+                .eq("user_id", user_id)\
+                .eq("table_name", record_table), "deleted_at", deleted_position)\
+                .limit(limit + 1)
+        )
+        deleted_rows = deleted_response.data
+    else:
+        changed_response = await db.execute(changed_query)
+        deleted_rows = []
+
+    changed, deleted = changed_response.data[:limit], deleted_rows[:limit]
+    changed_more = len(changed_response.data) > limit
+    deleted_more = len(deleted_rows) > limit
+
+    if changed:
+        changed_position = (changed[-1]["updated_at"], changed[-1]["id"])
+    if not changed_more:
+        changed_position = _caught_up(changed_position, cutoff)
+    if deleted:
+        deleted_position = (deleted[-1]["deleted_at"], deleted[-1]["id"])
+    if not deleted_more:
+        # A fresh snapshot only needs deletions from around now on
+        deleted_position = _caught_up(deleted_position if since else None, cutoff)
+        issued_at = now.isoformat()
+
+    return {
+        "changed": changed,
+        "deleted": [{"id": row["record_id"], "deleted_at": row["deleted_at"]} for row in deleted],
+        "watermark": encode_watermark(changed_position, deleted_position, issued_at),
+        "has_more": changed_more or deleted_more
+    }
+
@@ -0,0 +1,128 @@
+import os
+import asyncio
+from functools import cached_property
+from config.database import db
+from services.cache import TTLCache
+
+# Fields kept per employee in the directory
+DIRECTORY_COLUMNS = "id, name, department, is_active, specializations"
+# Employees read per query when loading a directory; keep at or below the
+# PostgREST max-rows setting (1000 by default) so no page is truncated
+DIRECTORY_PAGE_SIZE = int(os.getenv("DIRECTORY_PAGE_SIZE", "1000"))
+
+# Both caches are per worker process: the CRUD endpoints invalidate them
+# here, and other workers pick up changes once the TTL lapses.
+
+# Per-user ticket categories, ordered by name
+category_cache = TTLCache(
+    maxsize=int(os.getenv("DIRECTORY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("DIRECTORY_CACHE_TTL", "60"))
+)
+
+# Per-user employee directory: employee id -> DIRECTORY_COLUMNS row
+employee_directory_cache = TTLCache(
+    maxsize=int(os.getenv("DIRECTORY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("DIRECTORY_CACHE_TTL", "60"))
+)
+
+class EmployeeDirectory(dict):
+    """
+    A tenant's employees keyed by id, with a specialization index built
+    on first use and kept for as long as the directory is cached.
+    """
+
+    @cached_property
+    def by_specialization(self) -> dict:
+        """Case-folded specialization -> ids of employees who have it"""
+        index = {}
+        for emp_id, emp in self.items():
+            for spec in {s.casefold() for s in emp.get("specializations") or []}:
+                index.setdefault(spec, []).append(emp_id)
+        return index
+
+    @cached_property
+    def specializations(self) -> list:
+        """Every distinct specialization as entered, sorted"""
+        return sorted({spec for emp in self.values() for spec in emp.get("specializations") or []})
+
+    def with_specialization(self, specialization: str) -> list:
+        """Ids of employees with the given specialization, ignoring case"""
+        return self.by_specialization.get(specialization.casefold(), [])
+
+
+# In-flight loads, so concurrent misses for one user share a query
+_loading = {}
+# Bumped on invalidation, so a load that raced a write isn't cached
+_versions = {}
+
+
+async def _read_through(cache: TTLCache, kind: str, user_id: str, load):
+    value = cache.get(user_id)
+    if value is not None:
+        return value
+
+    key = (kind, user_id)
+    version = _versions.get(key, 0)
+    task = _loading.get(key)
+    if task is None:
+        task = asyncio.ensure_future(load(user_id))
+        _loading[key] = task
+
+        def forget(done):
+            if _loading.get(key) is done:
+                del _loading[key]
+        task.add_done_callback(forget)
+    value = await asyncio.shield(task)
+    if _versions.get(key, 0) == version:
+        cache.set(user_id, value)
+    return value
+
+
+def _invalidate(cache: TTLCache, kind: str, user_id: str):
+    key = (kind, user_id)
+    cache.invalidate(user_id)
+    _versions[key] = _versions.get(key, 0) + 1
+    _loading.pop(key, None)
+
+
+async def _load_categories(user_id: str) -> list:
+    response = await db.execute(db.table("ticket_categories")\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .order("name"))
+    return response.data
+
+
+async def _load_employee_directory(user_id: str) -> EmployeeDirectory:
+    # Paged in id order, so tenants past the max-rows cap load in full
+    directory = EmployeeDirectory()
+    last_id = None
+    while True:
+        query = db.table("employees")\
+            .select(DIRECTORY_COLUMNS)\
+            .eq("user_id", user_id)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        response = await db.execute(query.order("id").limit(DIRECTORY_PAGE_SIZE))
+        directory.update((emp["id"], emp) for emp in response.data)
+        if len(response.data) < DIRECTORY_PAGE_SIZE:
+            return directory
+        last_id = response.data[-1]["id"]
+
+
+async def get_categories(user_id: str) -> list:
+    """The user's ticket categories, from memory when fresh. Don't mutate."""
+    return await _read_through(category_cache, "categories", user_id, _load_categories)
+
+
+async def get_employee_directory(user_id: str) -> EmployeeDirectory:
+    """The user's employees keyed by id, from memory when fresh. Don't mutate."""
+    return await _read_through(employee_directory_cache, "employees", user_id, _load_employee_directory)
+
+
+def invalidate_categories(user_id: str):
+    _invalidate(category_cache, "categories", user_id)
+
+
+def invalidate_employee_directory(user_id: str):
+    _invalidate(employee_directory_cache, "employees", user_id)
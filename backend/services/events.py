@@ -0,0 +1,63 @@
+import os
+import asyncio
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Events buffered per connection before a slow client is told to resync
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+
+
+class EventHub:
+    """
+    In-process, tenant-scoped fan-out for change events.
+
+    Each subscriber gets a bounded queue. Publishing never waits: if a
+    subscriber has fallen behind and its queue is full, its backlog is
+    replaced by a single "resync" event telling the client to refetch.
+    Subscribers only see events published by this worker process.
+    """
+
+    def __init__(self, queue_size: int = STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event_type: str, data: dict = None):
+        """Queue an event for every open stream of this tenant"""
+        queues = self._subscribers.get(user_id)
+        if not queues:
+            return
+        event = {
+            "type": event_type,
+            "data": data or {},
+            "at": datetime.now(timezone.utc).isoformat()
+        }
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync", "data": {}, "at": event["at"]})
+
+    def subscriber_count(self, user_id: str = None) -> int:
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+event_hub = EventHub()
@@ -0,0 +1,73 @@
+import os
+import io
+import csv
+import json
+from fastapi.responses import StreamingResponse
+from config.database import db
+from services.pagination import apply_keyset, paginate
+
+# Rows fetched per round trip while streaming an export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+EXPORT_FORMAT_PATTERN = "^(csv|ndjson)$"
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _lookup(row: dict, column: str):
+    """Read a column, following dots into embedded resources (e.g. employees.name)"""
+    value = row
+    for part in column.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+async def _fetch_page(make_query, sort_column: str, cursor: str, page_size: int):
+    query = apply_keyset(make_query(), sort_column, cursor)
+    response = await db.execute(query.limit(page_size + 1))
+    rows, _, next_cursor = paginate(response.data, page_size, sort_column)
+    return rows, next_cursor
+
+
+def _encode(rows: list, columns: list, export_format: str, header: bool = False) -> str:
+    if export_format == "ndjson":
+        return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_lookup(row, column) for column in columns] for row in rows)
+    return buffer.getvalue()
+
+
+async def export_response(make_query, sort_column: str, columns: list, export_format: str, filename: str, page_size: int = EXPORT_PAGE_SIZE) -> StreamingResponse:
+    """
+    Stream every row matched by `make_query()` as CSV or NDJSON.
+
+    `make_query` must return a fresh filtered query on each call; pages are
+    read in (sort_column, id) keyset order, so only one page is held in
+    memory at a time. The first page is fetched before the response starts,
+    so a failing query still surfaces as a normal HTTP error. CSV output
+    uses `columns` (dotted names reach into embedded rows); NDJSON writes
+    each row as returned.
+    """
+    rows, cursor = await _fetch_page(make_query, sort_column, None, page_size)
+
+    async def body():
+        yield _encode(rows, columns, export_format, header=True)
+        next_cursor = cursor
+        while next_cursor:
+            page, next_cursor = await _fetch_page(make_query, sort_column, next_cursor, page_size)
+            yield _encode(page, columns, export_format)
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
@@ -0,0 +1,28 @@
+from fastapi import HTTPException
+
+FIELDS_DESCRIPTION = "Comma-separated list of fields to return (default: all)"
+
+
+def select_fields(fields: str, allowed: dict, required=("id",)) -> str:
+    """
+    Build a select() projection from a `fields=` value.
+
+    `allowed` maps each public field name to its select expression (a
+    column, or an embed such as "employees(id, name)"); unknown names are a
+    400. `required` fields (id and the keyset sort column) are always
+    included so cursors keep working. Without `fields`, every allowed
+    field is selected.
+    """
+    if not fields:
+        return ", ".join(allowed.values())
+
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+
+    names = list(dict.fromkeys([*required, *requested]))
+    return ", ".join(allowed[name] for name in names)
@@ -0,0 +1,103 @@
+import uuid
+import asyncio
+from functools import partial
+from fastapi import Depends
+from config.database import db
+from middleware.auth import get_current_user
+from services.directory import get_employee_directory
+
+# Ids per IN (...) lookup, keeping request URLs within length limits
+LOADER_BATCH_SIZE = 100
+
+# Ticket fields returned by Loaders.tickets
+TICKET_LOADER_COLUMNS = "id, ticket_number, title, status, priority, assigned_to"
+
+
+def _is_uuid(value) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+class DataLoader:
+    """
+    Batches by-key lookups and memoizes the results.
+
+    Keys passed to load() in the same event-loop tick are fetched together
+    by one `batch_load(keys) -> {key: value}` call per LOADER_BATCH_SIZE
+    keys, and each key is fetched at most once per loader. Keys missing
+    from the batch result resolve to None. A failed batch is raised to
+    every caller waiting on it and is not memoized.
+    """
+
+    def __init__(self, batch_load, max_batch_size: int = LOADER_BATCH_SIZE):
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self._futures = {}
+        self._queue = []
+
+    def load(self, key) -> asyncio.Future:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._queue:
+                loop.call_soon(self._dispatch)
+            self._queue.append(key)
+        return future
+
+    async def load_many(self, keys) -> list:
+        return await asyncio.gather(*[self.load(key) for key in keys])
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        for start in range(0, len(keys), self.max_batch_size):
+            asyncio.ensure_future(self._load_batch(keys[start:start + self.max_batch_size]))
+
+    async def _load_batch(self, keys: list):
+        try:
+            values = await self.batch_load(keys)
+        except Exception as e:
+            for key in keys:
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._futures[key]
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+async def _load_tickets(user_id: str, ids: list) -> dict:
+    # A malformed id can't match and would fail the whole IN query
+    ids = [i for i in ids if _is_uuid(i)]
+    if not ids:
+        return {}
+    response = await db.execute(db.table("tickets")\
+        .select(TICKET_LOADER_COLUMNS)\
+        .eq("user_id", user_id)\
+        .in_("id", ids))
+    return {row["id"]: row for row in response.data}
+
+
+async def _load_employees(user_id: str, ids: list) -> dict:
+    directory = await get_employee_directory(user_id)
+    return {i: directory[i] for i in ids if i in directory}
+
+
+class Loaders:
+    """The current user's DataLoaders, created once per request"""
+
+    def __init__(self, user_id: str):
+        # Ticket rows (TICKET_LOADER_COLUMNS) owned by the user
+        self.tickets = DataLoader(partial(_load_tickets, user_id))
+        # Employee directory entries, served from the directory cache
+        self.employees = DataLoader(partial(_load_employees, user_id))
+
+
+async def get_loaders(current_user=Depends(get_current_user)) -> Loaders:
+    """Dependency: FastAPI caches it per request, so handlers share one set"""
+    return Loaders(current_user.id)
@@ -0,0 +1,109 @@
+import uuid
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from config.database import db
+
+# Accepted values for the `count=` list parameter (PostgREST count methods)
+COUNT_PATTERN = "^(exact|planned|estimated)$"
+# Rows per query in read_all; keep at or below the PostgREST max-rows
+# setting (1000 by default) so no page is truncated
+READ_ALL_PAGE_SIZE = 1000
+
+
+def encode_cursor(row: dict, sort_column: str) -> str:
+    """Build an opaque cursor pointing just past `row` in (sort_column, id) order"""
+    raw = json.dumps([row[sort_column], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def parse_position(sort_value, row_id):
+    """
+    Validate a (sort_value, id) pair before it is written into a filter:
+    sort values are ISO dates or timestamps and ids are UUIDs, so neither
+    can carry quotes, commas or parentheses into the PostgREST expression.
+    """
+    if not isinstance(sort_value, str) or not isinstance(row_id, str):
+        raise ValueError("cursor values must be strings")
+    datetime.fromisoformat(sort_value.replace("Z", "+00:00"))
+    return sort_value, str(uuid.UUID(row_id))
+
+
+def decode_cursor(cursor: str):
+    """Return the (sort_value, id) pair stored in a cursor; 400 if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return parse_position(sort_value, row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_after(query, sort_column: str, sort_value: str, row_id: str, desc: bool = True):
+    """Filter to rows strictly after a validated (sort_value, id) position"""
+    op = "lt" if desc else "gt"
+    return query.or_(
+        f'{sort_column}.{op}."{sort_value}",'
+        f'and({sort_column}.eq."{sort_value}",id.{op}.{row_id})'
+    )
+
+
+def apply_keyset(query, sort_column: str, cursor: str = None, desc: bool = True):
+    """
+    Order a query by (sort_column, id) and, given a cursor, resume strictly
+    after it. Each page is an index range scan instead of an OFFSET skip.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = keyset_after(query, sort_column, sort_value, row_id, desc)
+    return query.order(sort_column, desc=desc).order("id", desc=desc)
+
+
+def paginate(rows: list, limit: int, sort_column: str):
+    """
+    Trim rows fetched with limit + 1 down to the page. The extra row only
+    signals that more exist, so returns (page_rows, has_more, next_cursor).
+    """
+    if not limit or len(rows) <= limit:
+        return rows, False, None
+    rows = rows[:limit]
+    return rows, True, encode_cursor(rows[-1], sort_column)
+
+
+def _filter_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return f'"{value}"'
+
+
+def _after_key(row: dict, key_columns: tuple) -> str:
+    """PostgREST or= expression for rows after `row` in key_columns order"""
+    clauses = []
+    for i, column in enumerate(key_columns):
+        terms = [f"{c}.eq.{_filter_value(row[c])}" for c in key_columns[:i]]
+        terms.append(f"{column}.gt.{_filter_value(row[column])}")
+        clauses.append(f"and({','.join(terms)})" if len(terms) > 1 else terms[0])
+    return ",".join(clauses)
+
+
+async def read_all(make_query, key_columns: tuple, page_size: int = READ_ALL_PAGE_SIZE) -> list:
+    """
+    Every row `make_query()` selects, which must include `key_columns`.
+    A single select stops at PostgREST's max-rows, so rows are read in
+    pages ordered by the unique key_columns, each resuming after the last
+    row of the one before.
+    """
+    rows = []
+    last = None
+    while True:
+        query = make_query()
+        if last is not None:
+            query = query.or_(_after_key(last, key_columns))
+        for column in key_columns:
+            query = query.order(column)
+        page = (await db.execute(query.limit(page_size))).data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last = page[-1]
@@ -0,0 +1,125 @@
+import heapq
+import random
+
+# (max active tickets, points, reason) - first matching tier wins
+WORKLOAD_TIERS = [
+    (0, 30, "Available (no active tickets)"),
+    (2, 20, "Light workload"),
+    (5, 10, "Moderate workload"),
+]
+HEAVY_WORKLOAD = (-10, "Heavy workload")
+
+# (min completed tickets, points, reason) - first matching tier wins
+EXPERIENCE_TIERS = [
+    (20, 15, "Highly experienced"),
+    (10, 10, "Experienced"),
+    (5, 5, "Some experience"),
+]
+
+SPECIALIZATION_POINTS = 50
+MAX_JITTER = 5
+
+
+def _workload_tier(active: int):
+    for max_active, points, reason in WORKLOAD_TIERS:
+        if active <= max_active:
+            return points, reason
+    return HEAVY_WORKLOAD
+
+
+def _experience_tier(completed: int):
+    for min_completed, points, reason in EXPERIENCE_TIERS:
+        if completed > min_completed:
+            return points, reason
+    return 0, None
+
+
+class CandidatePool:
+    """
+    Scores a tenant's employees against tickets.
+
+    Everything that doesn't depend on the ticket (workload and experience
+    points, case-folded specializations) is computed once when the pool is
+    built, so scoring a ticket is one pass over a list of ints plus an
+    index lookup for the specialization bonus.
+    """
+
+    def __init__(self, workload_rows: list):
+        self.employees = [emp for emp in workload_rows if emp.get("is_active", True)]
+        self.active = []
+        self.experience = []
+        self.base_scores = []
+        self.base_reasons = []
+        # case-folded specialization -> positions in self.employees
+        self.by_specialization = {}
+
+        for position, emp in enumerate(self.employees):
+            self.active.append(emp.get("active_tickets") or 0)
+            self.experience.append(_experience_tier(emp.get("completed_tickets") or 0))
+            self.base_scores.append(0)
+            self.base_reasons.append([])
+            self._rescore(position)
+
+            for spec in {s.casefold() for s in emp.get("specializations") or []}:
+                self.by_specialization.setdefault(spec, []).append(position)
+
+    def _rescore(self, position: int):
+        workload_points, workload_reason = _workload_tier(self.active[position])
+        experience_points, experience_reason = self.experience[position]
+        self.base_scores[position] = workload_points + experience_points
+        self.base_reasons[position] = [workload_reason] + ([experience_reason] if experience_reason else [])
+
+    def __len__(self):
+        return len(self.employees)
+
+    def specialists(self, category_name: str = None) -> list:
+        """Positions of employees specialized in the given category"""
+        if not category_name:
+            return []
+        return self.by_specialization.get(category_name.casefold(), [])
+
+    def scores(self, category_name: str = None) -> list:
+        """Score every candidate for a ticket in the given category"""
+        # Jitter keeps the same person from always topping ties
+        scores = [base + random.randint(0, MAX_JITTER) for base in self.base_scores]
+        for position in self.specialists(category_name):
+            scores[position] += SPECIALIZATION_POINTS
+        return scores
+
+    def recommend(self, category_name: str = None, limit: int = 5) -> list:
+        """Top `limit` candidates for a ticket, best first"""
+        scores = self.scores(category_name)
+        specialists = set(self.specialists(category_name))
+        top = heapq.nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        return [self.describe(position, scores[position], position in specialists, category_name) for position in top]
+
+    def plan_assignments(self, tickets: list) -> list:
+        """
+        Greedy load-aware assignment: tickets are handed out in the order
+        given, and each pick counts as one more active ticket for that
+        employee before the next ticket is scored. Mutates the pool.
+
+        `tickets` are (ticket_id, category_name) pairs; returns
+        (ticket_id, position, score) triples.
+        """
+        plan = []
+        if not self.employees:
+            return plan
+        for ticket_id, category_name in tickets:
+            scores = self.scores(category_name)
+            best = max(range(len(scores)), key=scores.__getitem__)
+            plan.append((ticket_id, best, scores[best]))
+            self.active[best] += 1
+            self._rescore(best)
+        return plan
+
+    def describe(self, position: int, score: int, is_specialist: bool, category_name: str = None) -> dict:
+        """Employee row annotated with its score and the reasons behind it"""
+        reasons = list(self.base_reasons[position])
+        if is_specialist:
+            reasons.insert(0, f"Specializes in {category_name}")
+        return {
+            **self.employees[position],
+            "recommendation_score": score,
+            "recommendation_reasons": reasons
+        }
@@ -7,6 +7,7 @@ import {
 import api from '../services/api';
 import TicketDetail from './TicketDetail';
 import { useApiNotifications } from '../hooks/useApiNotifications';
+import { useLiveUpdates } from '../hooks/useLiveUpdates';
 import './AdminDashboard.css';
 
 const AdminDashboard = () => {
@@ -34,15 +35,11 @@ const AdminDashboard = () => {
 
   useEffect(() => {
     fetchDashboardData();
-    
-    // Set up auto-refresh every 3 seconds for live updates
-    const interval = setInterval(() => {
-      fetchDashboardData(true); // Silent refresh
-    }, 3000);
-    
-    return () => clearInterval(interval);
   }, [statusFilter, priorityFilter, assigneeFilter, searchTerm]);
 
+  // Silent refresh whenever the server pushes a relevant change
+  useLiveUpdates(['ticket', 'employee', 'category'], () => fetchDashboardData(true));
+
   // Detect ticket changes and trigger notifications
   useEffect(() => {
     const previousTickets = previousTicketsRef.current;
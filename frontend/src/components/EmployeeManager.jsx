@@ -2,6 +2,7 @@ import { useState, useEffect, useRef } from 'react';
 import { Plus, Search, Edit2, Trash2, X, Users } from 'lucide-react';
 import api from '../services/api';
 import { useApiNotifications } from '../hooks/useApiNotifications';
+import { useLiveUpdates } from '../hooks/useLiveUpdates';
 import './EmployeeManager.css';
 
 const EmployeeManager = () => {
@@ -26,15 +27,11 @@ const EmployeeManager = () => {
 
   useEffect(() => {
     fetchEmployees();
-    
-    // Auto-refresh every 3 seconds
-    const interval = setInterval(() => {
-      fetchEmployees();
-    }, 3000);
-    
-    return () => clearInterval(interval);
   }, []);
 
+  // Refresh when the server pushes an employee change
+  useLiveUpdates(['employee'], fetchEmployees);
+
   // Detect employee changes and trigger notifications
   useEffect(() => {
     const previousEmployees = previousEmployeesRef.current;
@@ -45,7 +45,8 @@ const TicketDetail = ({ ticketId, onClose, onUpdate }) => {
 
   const fetchEmployees = async () => {
     try {
-      const response = await api.get('/employees');
+      // Only the assignee dropdown uses this list
+      const response = await api.get('/employees/?fields=id,name');
       setEmployees(response.employees || []);
     } catch (error) {
       console.error('Error fetching employees:', error);
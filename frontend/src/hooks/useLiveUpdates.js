@@ -0,0 +1,73 @@
+import { useEffect, useRef } from 'react';
+import api from '../services/api';
+
+// Reconnect delay after the stream drops (each attempt gets a fresh stream token)
+const RECONNECT_DELAY = 5000;
+// Bursts of events within this window trigger a single refresh
+const DEBOUNCE_DELAY = 250;
+
+/**
+ * Hook to refresh data when the server pushes change events
+ * Usage: useLiveUpdates(['ticket', 'employee'], () => fetchData(true));
+ * Event types look like `ticket.updated`; `resync` always triggers a refresh.
+ */
+export const useLiveUpdates = (resources, onChange) => {
+  const onChangeRef = useRef(onChange);
+  onChangeRef.current = onChange;
+  const resourcesKey = resources.join(',');
+
+  useEffect(() => {
+    let source = null;
+    let closed = false;
+    let reconnectTimer = null;
+    let debounceTimer = null;
+
+    const scheduleRefresh = () => {
+      clearTimeout(debounceTimer);
+      debounceTimer = setTimeout(() => onChangeRef.current(), DEBOUNCE_DELAY);
+    };
+
+    const reconnect = () => {
+      reconnectTimer = setTimeout(() => {
+        scheduleRefresh();
+        connect();
+      }, RECONNECT_DELAY);
+    };
+
+    const connect = async () => {
+      try {
+        source = await api.eventSource('/stream');
+      } catch (error) {
+        if (!closed) reconnect();
+        return;
+      }
+      if (closed) {
+        source.close();
+        return;
+      }
+
+      ['resync', ...resourcesKey.split(',').flatMap(resource => [
+        `${resource}.created`,
+        `${resource}.updated`,
+        `${resource}.deleted`,
+        `${resource}.commented`,
+      ])].forEach(type => source.addEventListener(type, scheduleRefresh));
+
+      source.onerror = () => {
+        // EventSource's own retry would reuse the spent stream token, so
+        // close it and reconnect with a new one
+        source.close();
+        if (!closed) reconnect();
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      clearTimeout(debounceTimer);
+      if (source) source.close();
+    };
+  }, [resourcesKey]);
+};
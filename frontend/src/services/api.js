@@ -70,6 +70,14 @@ const api = {
       body: JSON.stringify(data),
     });
   },
+
+  // Server-sent events stream. EventSource can't send headers, so the URL carries
+  // a short-lived, single-use stream token rather than the access token.
+  async eventSource(endpoint) {
+    const { token } = await this.post(`${endpoint}/token`);
+    const queryString = new URLSearchParams({ token }).toString();
+    return new EventSource(`${API_URL}${endpoint}?${queryString}`);
+  },
 };
 
 export default api;